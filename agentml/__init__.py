@@ -2,11 +2,19 @@ from __future__ import print_function, unicode_literals
 from six import string_types
 import os
 import re
+import random
+import hashlib
 import logging
+import threading
 from time import time
+from collections import OrderedDict
+from heapq import merge
 from lxml import etree
 # from typewriter import typewrite
-from agentml.common import schema, normalize, attribute, int_attribute, newlines_to_spaces
+from agentml.common import schema, element_schema, normalize, compile_pattern, compile_words, attribute, \
+    int_attribute, newlines_to_spaces, TrackedRandom, VariableStore, ReadCache
+from agentml import tracing
+from agentml.matcher import TokenTrie
 from agentml.parser.init import Init
 from agentml.parser.trigger import Trigger
 from agentml.parser.tags import Condition, Redirect, Random, Var, Tag
@@ -23,13 +31,51 @@ __maintainer__ = "Makoto Fujimoto"
 
 
 class AgentML:
-    def __init__(self, log_level=logging.WARN):
+    MATCHERS = ('regex', 'trie')
+    VALIDATION_MODES = ('full', 'once', 'off')
+
+    # Suffix of the validation cache entries of files that passed validation element by element while streamed
+    STREAM_VALIDATED = ':stream'
+
+    def __init__(self, log_level=logging.WARN, rng=None, matcher='regex', validation='full', validation_cache=None,
+                 lazy=False):
         """
         Initialize a new AgentML instance
 
         :param log_level: The debug logging level, defaults to logging.WARN
         :type  log_level: int
+
+        :param rng: The random number generator to use for replies, defaults to a new random.Random instance. Pass a
+            seeded instance for reproducible replies
+        :type  rng: random.Random or None
+
+        :param matcher: The matching engine, one of AgentML.MATCHERS. 'regex' tests every candidate trigger's pattern
+            in turn, 'trie' first narrows the candidates down using a token trie (see agentml.matcher)
+        :type  matcher: str
+
+        :param validation: How loaded files are validated against the AgentML schema, one of AgentML.VALIDATION_MODES.
+            'full' validates every file every time it is loaded. 'once' records the content hash of every file that
+            passes validation in the validation cache, and skips validating files that have already passed. Files only
+            validated element by element while streamed are still validated in full when loaded whole. 'off' skips
+            validation entirely. 'once' is recommended in production, so repeated boots of the same brain don't
+            pay for validation again
+        :type  validation: str
+
+        :param validation_cache: Path to the file validated content hashes are recorded in when validating 'once',
+            defaults to ~/.cache/agentml/validated
+        :type  validation_cache: str or None
+
+        :param lazy: Whether triggers are loaded lazily. Lazily loaded triggers only parse what is needed to sort and
+            match them up front, and build their responses, conditions and templates the first time they match.
+            Errors in those elements are then logged on first match instead of when the file is loaded
+        :type  lazy: bool
         """
+        if matcher not in self.MATCHERS:
+            raise ValueError('Unknown matcher: {matcher}'.format(matcher=matcher))
+
+        if validation not in self.VALIDATION_MODES:
+            raise ValueError('Unknown validation mode: {mode}'.format(mode=validation))
+
         # Debug logger
         self._log = logging.getLogger('agentml')
         self._log.setLevel(log_level)
@@ -43,38 +89,98 @@ class AgentML:
         self.script_path = os.path.dirname(os.path.realpath(__file__))
         self._schema_path = os.path.join(self.script_path, 'schemas', 'agentml.rng')
 
-        # Schema validator
+        # Schema validator, and validators for the individual elements read by the streaming loader (built on first use)
         with open(self._schema_path) as file:
             self._schema = schema(file.read())
+        self._element_schemas = None
+
+        # Schema validation mode, and the content hashes of files that have passed validation (read on first use)
+        self.validation = validation
+        self.validation_cache = validation_cache or os.path.join(os.path.expanduser('~'), '.cache', 'agentml',
+                                                                 'validated')
+        self._validated = None
 
         # Define our base / system tags
         self._tags = {'condition': Condition, 'redirect': Redirect, 'random': Random, 'var': Var}
         self.conditions = {'user_var': UserVarType(), 'global_var': GlobalVarType(), 'topic': TopicType(),
                            'user': UserType()}
 
+        # Incremented whenever a condition type is added, so condition statements know to re-bind their types
+        self.condition_generation = 0
+
         # Containers
-        self._global_vars   = {}
+        self._global_vars   = VariableStore()
         self._limits        = {}
         self._users         = {}
         self._triggers      = {}
-        self._substitutions = []
+        self._substitutions = ({}, {}, {})
+
+        # Expressions matching every substituted word, for each message format (built on first use)
+        self._substitution_patterns = None
+
+        # Literal redirect messages, and the triggers they resolve to (built on first use after sorting)
+        self._redirect_targets = set()
+        self._static_redirects = {}
+
+        # Canonical instances of immutable values loaded from triggers, so identical content is only stored once. Kept
+        # across sorts so triggers loaded later share values with earlier ones, until clear_interned() is called
+        self._interned = {}
+
+        # Whether triggers are loaded lazily, and the lock held while a lazily loaded trigger builds its responses
+        self.lazy = lazy
+        self.lazy_lock = threading.RLock()
 
         # Loggers
         self.request_log = RequestLogger()
         self.response_log = ResponseLogger()
 
+        # Random number generator and the per-thread stack of active request contexts
+        self.rng = rng if rng is not None else random.Random()
+        self._local = threading.local()
+
+        # The maximum number of nested redirects a single request may follow
+        self.max_redirect_depth = 20
+
+        # Recently parsed messages, most recently used last, and the maximum number of them kept (0 disables caching)
+        self._message_cache = OrderedDict()
+        self._message_cache_lock = threading.Lock()
+        self.message_cache_size = 1000
+
+        # An optional agentml.profiler.Profiler instance that collects per-trigger match statistics
+        self.profiler = None
+
+        # Dispatches request stage events to trace hooks, only set while hooks are registered
+        self.tracer = None
+
         # Triggers must be sorted before replies are retrieved
         self.sorted = False
         self._sorted_triggers = []
 
+        # The number of triggers in each topic, including None for triggers outside of a topic
+        self._topics = {}
+
+        # Sorted triggers indexed by topic and then by the set of groups they require, as (sort order, trigger), and
+        # the candidate lists merged from them for each (topic, request groups) pair requested since sorting, along
+        # with the same candidates as sets for filtering the triggers matched by the token trie
+        self._topic_groups = {}
+        self._candidates = {}
+        self._candidate_sets = {}
+
+        # The token trie of the sorted triggers, when the trie matcher is enabled
+        self.matcher = matcher
+        self._trie = None
+
         # Load internal AgentML files
         self.load_directory(os.path.join(self.script_path, 'intelligence'))
 
-    def load_directory(self, dir_path):
+    def load_directory(self, dir_path, stream=False):
         """
         Load all AgentML files contained in a specified directory
         :param dir_path: Path to the directory
         :type  dir_path: str
+
+        :param stream: Load each file with the streaming loader (see load_file)
+        :type  stream: bool
         """
         self._log.info('Loading all AgentML files contained in: ' + dir_path)
 
@@ -86,30 +192,60 @@ class AgentML:
 
         # Loop through the files and load each one individually
         for file in aml_files:
-            self.load_file(file)
+            self.load_file(file, stream)
 
-    def load_file(self, file_path):
+    def load_file(self, file_path, stream=False):
         """
         Load a single AgentML file
         :param file_path: Path to the file
         :type  file_path: str
+
+        :param stream: Read the file incrementally, validating and loading each trigger as soon as it has been read
+            instead of building and validating the whole document first. Recommended for very large files. Triggers
+            read before an invalid element is found remain loaded
+        :type  stream: bool
         """
-        self._log.info('Loading file: ' + file_path)
-        agentml = etree.parse(file_path)
+        # Files that have already passed validation don't need to be validated again. Streamed files are only validated
+        # element by element, so they are recorded separately and don't excuse the whole document from validation
+        digest = self._file_digest(file_path) if self.validation == 'once' else None
+        validate = self.validation == 'full'
+        if digest is not None:
+            validated = self._get_validated()
+            if stream:
+                validate = digest not in validated and digest + self.STREAM_VALIDATED not in validated
+            else:
+                validate = digest not in validated
+
+        if stream:
+            self._stream_file(file_path, validate)
+        else:
+            self._log.info('Loading file: ' + file_path)
+            agentml = etree.parse(file_path)
+
+            # Validate the file for proper AgentML syntax
+            if validate:
+                self._schema.assertValid(agentml)
+
+            self._load_tree(agentml, file_path)
+
+        if validate and digest is not None:
+            self._add_validated(digest + self.STREAM_VALIDATED if stream else digest)
 
-        # Validate the file for proper AgentML syntax
-        self._schema.assertValid(agentml)
+    def _load_tree(self, agentml, file_path):
+        """
+        Load the elements of a parsed AgentML document
+        :param agentml: The parsed document
+        :type  agentml: etree._ElementTree
 
+        :param file_path: The absolute path to the AgentML file
+        :type  file_path: str
+        """
         # Get our root element and parse all elements inside of it
-        root = etree.parse(file_path).getroot()
+        root = agentml.getroot()
         defaults = {}
 
         def parse_element(element):
             for child in element:
-                # Initialization
-                if child.tag == 'init':
-                    Init(self, child, file_path)
-
                 # Set the group
                 if child.tag == 'group':
                     self._log.info('Setting Trigger group: {group}'.format(group=child.get('name')))
@@ -134,16 +270,154 @@ class AgentML:
                     del defaults['emotion']
                     continue
 
-                # Parse a standard Trigger element
-                if child.tag == 'trigger':
-                    try:
-                        self.add_trigger(Trigger(self, child, file_path, **defaults))
-                    except AgentMLError:
-                        self._log.warn('Skipping Trigger due to an error', exc_info=True)
+                # Initialization and standard Trigger elements
+                self._load_element(child, file_path, defaults)
 
         # Begin element iteration by parsing the root element
         parse_element(root)
 
+    def _stream_file(self, file_path, validate=True):
+        """
+        Load a single AgentML file incrementally. Init and trigger elements are validated against their own part of the
+        schema and loaded as soon as they have been read, then detached from the document, so the document never holds
+        more than the element being read
+        :param file_path: Path to the file
+        :type  file_path: str
+
+        :param validate: Whether elements should be validated against the schema
+        :type  validate: bool
+        """
+        self._log.info('Streaming file: ' + file_path)
+        schemas = self._get_element_schemas()
+
+        # Scope elements, and the trigger defaults they set
+        scopes = {'group': 'groups', 'topic': 'topic', 'emotion': 'emotion'}
+        defaults = {}
+        depth = 0  # how deep inside of the init or trigger element being read we are
+
+        # Open the file ourselves, so it's closed even if reading is abandoned partway through
+        with open(file_path, 'rb') as file:
+            for event, element in etree.iterparse(file, events=('start', 'end'), remove_comments=True, remove_pis=True):
+                if event == 'start':
+                    if depth:
+                        depth += 1
+                    elif element.tag in schemas:
+                        depth = 1
+                    elif element.tag in scopes:
+                        name = element.get('name')
+                        if name is None:
+                            raise etree.DocumentInvalid('{tag} element without a name, line {line}'
+                                                        .format(tag=element.tag, line=element.sourceline))
+
+                        self._log.info('Setting Trigger {scope}: {name}'.format(scope=element.tag, name=name))
+                        defaults[scopes[element.tag]] = {name} if element.tag == 'group' else name
+                    elif element.getparent() is None and (element.tag != 'agentml' or element.get('version') is None):
+                        raise etree.DocumentInvalid('Expected an agentml element with a version, line {line}'
+                                                    .format(line=element.sourceline))
+                    continue
+
+                if depth > 1:
+                    depth -= 1
+                    continue
+
+                # The init or trigger element has been read in full
+                if depth:
+                    depth = 0
+                    if validate:
+                        schemas[element.tag].assertValid(element)
+                    self._load_element(element, file_path, defaults)
+                    element.getparent().remove(element)
+                elif element.tag in scopes:
+                    defaults.pop(scopes[element.tag], None)
+
+    def _file_digest(self, file_path):
+        """
+        Hash the contents of a file along with the schema it is validated against
+        :param file_path: Path to the file
+        :type  file_path: str
+
+        :return: The hexadecimal SHA-1 digest
+        :rtype : str
+        """
+        digest = hashlib.sha1()
+        for path in (self._schema_path, file_path):
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(65536), b''):
+                    digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _get_validated(self):
+        """
+        Retrieve the content hashes of files that have passed validation
+        :rtype: set of str
+        """
+        if self._validated is None:
+            self._validated = set()
+            try:
+                with open(self.validation_cache) as file:
+                    self._validated.update(line.strip() for line in file)
+            except (IOError, OSError):
+                self._log.info('No validation cache found at: ' + self.validation_cache)
+
+        return self._validated
+
+    def _add_validated(self, digest):
+        """
+        Record the content hash of a file that has passed validation
+        :param digest: The content hash
+        :type  digest: str
+        """
+        self._get_validated().add(digest)
+
+        try:
+            cache_dir = os.path.dirname(self.validation_cache)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+
+            with open(self.validation_cache, 'a') as file:
+                file.write(digest + '\n')
+        except (IOError, OSError):
+            self._log.warn('Unable to write to the validation cache: ' + self.validation_cache, exc_info=True)
+
+    def _get_element_schemas(self):
+        """
+        Retrieve the validators of the elements loaded by the streaming loader
+        :return: Dictionary of RelaxNG validators keyed by element tag
+        :rtype : dict
+        """
+        if self._element_schemas is None:
+            with open(self._schema_path) as file:
+                relaxng = file.read()
+
+            self._element_schemas = {'init': element_schema(relaxng, 'initGroup'),
+                                     'trigger': element_schema(relaxng, 'trigger')}
+
+        return self._element_schemas
+
+    def _load_element(self, element, file_path, defaults):
+        """
+        Load an init or trigger element
+        :param element: The XML Element object
+        :type  element: etree._Element
+
+        :param file_path: The absolute path to the AgentML file
+        :type  file_path: str
+
+        :param defaults: The default attributes of triggers in the current scope
+        :type  defaults: dict
+        """
+        # Initialization
+        if element.tag == 'init':
+            Init(self, element, file_path)
+
+        # Parse a standard Trigger element
+        if element.tag == 'trigger':
+            try:
+                self.add_trigger(Trigger(self, element, file_path, **defaults))
+            except AgentMLError:
+                self._log.warn('Skipping Trigger due to an error', exc_info=True)
+
     def sort(self):
         """
         Sort triggers and their associated responses
@@ -165,14 +439,69 @@ class AgentML:
 
         # Finally, sort triggers by priority
         self._sorted_triggers = []
+        self._topics = {}
+        self._topic_groups = {}
+        self._candidates = {}
+        self._candidate_sets = {}
+        self._static_redirects = {}
 
         for triggers in [self._triggers[priority] for priority in sorted(self._triggers.keys(), reverse=True)]:
             for trigger in triggers:
                 self._sorted_triggers.append(trigger)
 
+        # Index the sorted triggers by topic and groups. Requests for any group get a dedicated list for each topic
+        for order, trigger in enumerate(self._sorted_triggers):
+            self._topics[trigger.topic] = self._topics.get(trigger.topic, 0) + 1
+            groups = self._topic_groups.setdefault(trigger.topic, {})
+            groups.setdefault(frozenset(trigger.groups or {None}), []).append((order, trigger))
+            self._candidates.setdefault((trigger.topic, AnyGroup), []).append(trigger)
+
+        self._validate_topics()
+
+        # Compile the sorted triggers into a token trie
+        self._trie = None
+        if self.matcher == 'trie':
+            self._trie = TokenTrie()
+            for trigger in self._sorted_triggers:
+                self._trie.add(trigger, trigger.pattern_text)
+
+            self._log.info('Compiled {compiled} of {total} trigger patterns into the token trie'
+                           .format(compiled=self._trie.compiled, total=len(self._sorted_triggers)))
+
         self.sorted = True
 
-    def get_reply(self, user, message, groups=None):
+    def _validate_topics(self):
+        """
+        Warn about responses that move users into topics without any triggers. Lazily loaded triggers that haven't built
+        their responses yet are skipped, responses setting a missing topic are still warned about when applied
+        """
+        missing = {}
+        for trigger in self._sorted_triggers:
+            if not trigger.materialized:
+                continue
+
+            for response in trigger.responses:
+                if response.topic and response.topic not in self._topics:
+                    missing.setdefault(response.topic, set()).add(trigger.file_path)
+
+        for topic, file_paths in missing.items():
+            self._log.warn('Responses in {paths} set the topic "{topic}", which has no triggers'
+                           .format(paths=', '.join(sorted(file_paths)), topic=topic))
+
+    def has_topic(self, topic):
+        """
+        Test whether or not a topic has any triggers. The empty topic, None, is always considered valid
+        :param topic: The name of the topic
+        :type  topic: str or None
+
+        :rtype: bool
+        """
+        if not self.sorted:
+            self.sort()
+
+        return topic is None or topic in self._topics
+
+    def get_reply(self, user, message, groups=None, rng=None):
         """
         Attempt to retrieve a reply to the provided message
         :param user: The user / client. This can be a hostmask, IP address, database ID or any other unique identifier
@@ -184,44 +513,245 @@ class AgentML:
         :param groups: The trigger groups to search, defaults to only matching non-grouped triggers
         :type  groups: set or AnyGroup
 
+        :param rng: The random number generator to use for this request, defaults to the instance generator
+        :type  rng: random.Random or None
+
         :rtype: str or None
         """
         # Make sure triggers have been sorted since the most recent trigger was added
         if not self.sorted:
             self.sort()
 
-        user = self.get_user(user)
-        groups = groups or {None}
+        tracer = self.tracer
+        start = tracer.start(tracing.REQUEST) if tracer else None
 
-        # Log this request
-        message = Message(self, message)
-        request_log_entry = self.request_log.add(user, message, groups)
+        try:
+            user = self.get_user(user)
+            groups = groups or {None}
 
-        # Fetch triggers in our topic and make sure we're not in an empty topic
-        triggers = [trigger for trigger in self._sorted_triggers if user.topic == trigger.topic]
+            # Normalize the message and prepare a record of this request
+            if tracer is None:
+                message = Message(self, message)
+            else:
+                message = tracer.call(tracing.NORMALIZE, Message, self, message)
+            request = self.request_log.record(user, message, groups)
 
-        if not triggers and user.topic is not None:
-            self._log.warn('User "{user}" was in an empty topic: {topic}'.format(user=user.id, topic=user.topic))
-            user.topic = None
-            triggers = [trigger for trigger in self._sorted_triggers if user.topic == trigger.topic]
+            # Make the request context available for the duration of the request
+            context = Context(self, user, message, groups, rng)
+            contexts = self._contexts
+            contexts.append(context)
 
-        # It's impossible to get anywhere if there are no empty topic triggers available to guide us
-        if not triggers:
-            raise AgentMLError('There are no empty topic triggers defined, unable to continue')
+            try:
+                return self._get_reply(context, message, request)
+            finally:
+                contexts.pop()
 
-        # Fetch triggers in our group and make sure we're not in an empty topic
-        if groups is not AnyGroup:
-            triggers = [trigger for trigger in triggers if groups.issuperset(trigger.groups or {None})]
+                # Log this request, along with its response if one was returned
+                self.request_log.add(request, context.response)
+        finally:
+            if tracer:
+                tracer.end(tracing.REQUEST, start)
 
-        if not triggers:
+    def _get_reply(self, context, message, request=None):
+        """
+        Attempt to retrieve a reply within an active request context
+        :param context: The request context
+        :type  context: Context
+
+        :param message: The message to retrieve a reply to
+        :type  message: Message
+
+        :param request: The request record to log the response against, if the response should be logged
+        :type  request: agentml.logger.Request or None
+
+        :rtype: str or None
+        """
+        user = context.user
+        tracer = self.tracer
+
+        # Look up the triggers whose patterns may match the message in the token trie
+        matches = None
+        if self._trie is not None:
+            if tracer is None:
+                matches = self._trie.candidates(message.normalized, message.words)
+            else:
+                matches = tracer.call(tracing.MATCH, self._trie.candidates, message.normalized, message.words)
+
+        # Attempt the user's topic first. If nothing in it can be matched, exit the topic and retry without it
+        while True:
+            if tracer is None:
+                triggers = self._get_candidates(context)
+            else:
+                triggers = tracer.call(tracing.CANDIDATES, self._get_candidates, context)
+            if triggers is None:
+                return
+
+            # Only attempt the candidates the token trie matched
+            if matches is not None:
+                triggers = self._filter_triggers(context, matches)
+
+            for trigger in triggers:
+                try:
+                    match = trigger.match(user, message)
+                except ParserBlockingError:
+                    return
+
+                if match:
+                    message = str(match)
+                    if request:
+                        context.response = self.response_log.add(message, request, trigger.id)
+                    return message
+
+            # If we're still here, no reply was matched. If we're in a topic, exit and retry
+            if not user.topic:
+                return
+
+            self._log.info('No reply matched in the topic "{topic}", resetting topic to None and retrying'
+                           .format(topic=user.topic))
+            self._reset_topic(context)
+
+    @staticmethod
+    def _reset_topic(context):
+        """
+        Move the requesting user out of their topic, so matching can be retried without it
+        :param context: The active request context
+        :type  context: Context
+        """
+        context.user.topic = None
+        context.reads.invalidate('topic')
+
+    def _get_candidates(self, context):
+        """
+        Retrieve the triggers that may be attempted for the user's current topic and the request groups. If the user
+        is in an empty topic, or a topic with no triggers in the request groups, their topic is reset
+        :param context: The request context
+        :type  context: Context
+
+        :return: The candidate triggers in sorted order, or None if there are no triggers that can be attempted
+        :rtype : list of Trigger or None
+        """
+        user = context.user
+        groups = context.groups
+
+        while True:
+            if user.topic not in self._topics:
+                # Make sure we're not in an empty topic
+                if user.topic is not None:
+                    self._log.warn('User "{user}" was in an empty topic: {topic}'
+                                   .format(user=user.id, topic=user.topic))
+                    self._reset_topic(context)
+                    continue
+
+                # It's impossible to get anywhere if there are no empty topic triggers available to guide us
+                raise AgentMLError('There are no empty topic triggers defined, unable to continue')
+
+            triggers = self._group_candidates(user.topic, groups)
+            if triggers:
+                return triggers
+
+            # Make sure we're not in a topic we don't have the groups to match anything in
             if not user.topic:
                 self._log.info('There are no topicless triggers matching the specific groups available, giving up')
                 return
 
             self._log.info('The topic "{topic}" has triggers, but we are not in the required groups to match them. '
-                           'Resetting topic to None and retrying'.format(topic=user.topic, groups=str(groups)))
-            user.topic = None
-            triggers = [trigger for trigger in self._sorted_triggers if user.topic == trigger.topic]
+                           'Resetting topic to None and retrying'.format(topic=user.topic))
+            self._reset_topic(context)
+
+    def resolve_redirect(self, message):
+        """
+        Retrieve a reply to a redirected message within the active request
+        :param message: The message being redirected to
+        :type  message: str
+
+        :rtype: str or None
+
+        :raises AgentMLError: There is no active request to resolve the redirect in
+        """
+        tracer = self.tracer
+        if tracer is None:
+            return self._resolve_redirect(message)
+
+        return tracer.call(tracing.REDIRECT, self._resolve_redirect, message)
+
+    def _resolve_redirect(self, message):
+        """
+        Retrieve a reply to a redirected message within the active request
+        :param message: The message being redirected to
+        :type  message: str
+
+        :rtype: str or None
+        """
+        context = self.context
+        if context is None:
+            raise AgentMLError('Redirects can only be resolved while a reply is being retrieved')
+
+        tracer = self.tracer
+        message = Message(self, message) if tracer is None else tracer.call(tracing.NORMALIZE, Message, self, message)
+        key = (message.normalized, context.user.topic)
+
+        # Have we already resolved this redirect during this request?
+        if key in context.redirect_cache:
+            self._log.info('Using the cached resolution of the redirect: {msg}'.format(msg=message.normalized))
+            return context.redirect_cache[key]
+
+        # Make sure we're not stuck in a redirect loop
+        if key in context.redirects:
+            self._log.warn('Redirect loop detected, refusing to redirect to "{msg}" again (Redirect chain: {chain})'
+                           .format(msg=message.normalized, chain=' => '.join(k[0] for k in context.redirects)))
+            return
+
+        if len(context.redirects) >= self.max_redirect_depth:
+            self._log.warn('Maximum redirect depth of {depth} reached, refusing to redirect to "{msg}"'
+                           .format(depth=self.max_redirect_depth, msg=message.normalized))
+            return
+
+        # Resolve the redirect, keeping track of whether or not it had any side effects
+        effects = context.effects
+        rng = context.rng
+        context.rng = TrackedRandom(rng)
+        context.redirects.append(key)
+
+        try:
+            if message.raw in self._redirect_targets:
+                reply = self._get_static_reply(context, message)
+            else:
+                reply = self._get_reply(context, message)
+        finally:
+            context.redirects.pop()
+            tracked_rng, context.rng = context.rng, rng
+
+        # Redirects that didn't set any limits, variables or topics and didn't make any random selections will always
+        # resolve to the same reply for the rest of this request
+        if context.effects == effects and not tracked_rng.used:
+            self._log.debug('Caching the resolution of the redirect: {msg}'.format(msg=message.normalized))
+            context.redirect_cache[key] = reply
+
+        return reply
+
+    def _get_static_reply(self, context, message):
+        """
+        Retrieve a reply to a literal redirect message by jumping straight to the triggers its message matches
+        :param context: The request context
+        :type  context: Context
+
+        :param message: The literal redirect message
+        :type  message: Message
+
+        :rtype: str or None
+        """
+        # Find every trigger this message can ever match, in the order they would be attempted
+        if message.raw not in self._static_redirects:
+            self._log.debug('Resolving literal redirect targets for: {msg}'.format(msg=message.raw))
+            self._static_redirects[message.raw] = \
+                [trigger for trigger in self._sorted_triggers if trigger.matches(message.normalized)]
+
+        user = context.user
+        triggers = self._filter_triggers(context, self._static_redirects[message.raw])
+
+        # Empty topics and groups are handled by the standard reply path
+        if not triggers:
+            return self._get_reply(context, message)
 
         for trigger in triggers:
             try:
@@ -230,18 +760,102 @@ class AgentML:
                 return
 
             if match:
-                message = str(match)
-                request_log_entry.response = self.response_log.add(message, request_log_entry)
-                return message
+                return str(match)
 
-        # If we're still here, no reply was matched. If we're in a topic, exit and retry
+        # All of the targets were limited or failed their conditions. If we're in a topic, exit and retry
         if user.topic:
             self._log.info('No reply matched in the topic "{topic}", resetting topic to None and retrying'
                            .format(topic=user.topic))
-            user.topic = None
+            self._reset_topic(context)
+            return self._get_reply(context, message)
+
+    def _group_candidates(self, topic, groups):
+        """
+        Retrieve the triggers in a topic that may be attempted with the specified request groups
+        :param topic: The topic
+        :type  topic: str or None
+
+        :param groups: The request groups
+        :type  groups: set or AnyGroup
+
+        :return: The triggers in sorted order
+        :rtype : list of Trigger
+        """
+        key = (topic, AnyGroup if groups is AnyGroup else frozenset(groups))
+        try:
+            return self._candidates[key]
+        except KeyError:
+            topic_groups = self._topic_groups.get(topic, {})
+
+            # Merge the triggers of every set of groups the request is in, keeping them in sort order
+            lists = [triggers for trigger_groups, triggers in topic_groups.items()
+                     if groups is AnyGroup or trigger_groups <= key[1]]
+
+            candidates = self._candidates[key] = [trigger for order, trigger in merge(*lists)]
+            return candidates
+
+    def _group_candidate_set(self, topic, groups):
+        """
+        Retrieve the triggers in a topic that may be attempted with the specified request groups, as a set
+        :param topic: The topic
+        :type  topic: str or None
+
+        :param groups: The request groups
+        :type  groups: set or AnyGroup
+
+        :rtype: frozenset of Trigger
+        """
+        key = (topic, AnyGroup if groups is AnyGroup else frozenset(groups))
+        try:
+            return self._candidate_sets[key]
+        except KeyError:
+            candidates = self._candidate_sets[key] = frozenset(self._group_candidates(topic, groups))
+            return candidates
+
+    def _filter_triggers(self, context, triggers):
+        """
+        Filter triggers down to the candidates for the user's current topic and the request groups
+        :param context: The request context
+        :type  context: Context
+
+        :param triggers: The triggers to filter
+        :type  triggers: list of Trigger
+
+        :return: The triggers that are candidates, in the order they were provided
+        :rtype : list of Trigger
+        """
+        candidates = self._group_candidate_set(context.user.topic, context.groups)
+        return [trigger for trigger in triggers if trigger in candidates]
+
+    @property
+    def _contexts(self):
+        """
+        Return the stack of active request contexts for the current thread
+        :rtype: list of Context
+        """
+        try:
+            return self._local.contexts
+        except AttributeError:
+            self._local.contexts = []
+            return self._local.contexts
 
-            # noinspection PyTypeChecker
-            return self.get_reply(user.id, message.raw)
+    @property
+    def context(self):
+        """
+        Return the context of the request currently being processed, or None if no request is active
+        :rtype: Context or None
+        """
+        contexts = self._contexts
+        return contexts[-1] if contexts else None
+
+    def get_rng(self):
+        """
+        Retrieve the random number generator for the request currently being processed
+        :return: The request's random number generator, or the instance generator if no request is active
+        :rtype : random.Random
+        """
+        context = self.context
+        return context.rng if context else self.rng
 
     def add_trigger(self, trigger):
         """
@@ -260,41 +874,78 @@ class AgentML:
         # Otherwise, add this trigger to an existing priority list
         self._triggers[trigger.priority].append(trigger)
 
-    def set_substitution(self, word, substitution):
+    def add_redirect_target(self, message):
         """
-        Add a word substitution
-        :param word: The word to replace
-        :type  word: str
+        Register a literal redirect message, allowing the triggers it resolves to be looked up directly
+        :param message: The literal message being redirected to
+        :type  message: str
+        """
+        self._redirect_targets.add(message)
 
-        :param substitution: The word's substitution
-        :type  substitution: str
+    def intern(self, value, factory=None):
         """
-        # Parse the word and its substitution
-        raw_word = re.escape(word)
-        raw_substitution = substitution
+        Retrieve the canonical instance of an immutable value, storing it if this is the first time it has been seen.
+        Identical patterns, template text and static random choices loaded from different triggers then share a single
+        object rather than each holding a copy
+        :param value: A hashable, immutable value (such as a string or a tuple of strings)
 
-        case_word = re.escape(normalize(word, preserve_case=True))
-        case_substitution = normalize(substitution, preserve_case=True)
+        :param factory: If provided, the object built by factory(value) is shared instead of the value itself
+        :type  factory: callable or None
 
-        word = re.escape(normalize(word))
-        substitution = normalize(substitution)
+        :return: The canonical instance equal to value, or the shared object built from it
+        """
+        key = value if factory is None else (factory, value)
 
-        # Compile and group the regular expressions
-        raw_sub = (re.compile(r'\b{word}\b'.format(word=raw_word), re.IGNORECASE), raw_substitution)
-        case_sub = (re.compile(r'\b{word}\b'.format(word=case_word), re.IGNORECASE), case_substitution)
-        sub = (re.compile(r'\b{word}\b'.format(word=word), re.IGNORECASE), substitution)
+        try:
+            return self._interned[key]
+        except KeyError:
+            interned = self._interned[key] = value if factory is None else factory(value)
+            return interned
 
-        sub_group = (sub, case_sub, raw_sub)
+    def clear_interned(self):
+        """
+        Discard the table of canonical values. Values already loaded remain shared, but triggers loaded (or lazily
+        materialized) afterwards will no longer share values with them. Call this once no more files will be loaded to
+        release the memory held by the table
+        """
+        self._interned = {}
+
+    def set_substitution(self, word, substitution):
+        """
+        Add a word substitution. Substitutions are matched case-insensitively as whole words, and if a word is
+        substituted more than once the first substitution is kept
+        :param word: The word to replace
+        :type  word: str
 
-        # Make sure this substitution hasn't already been processed and add it to the substitutions list
-        if sub_group not in self._substitutions:
-            self._log.info('Appending new word substitution: "{word}" => "{sub}"'.format(word=word, sub=substitution))
-            self._substitutions.append(sub_group)
+        :param substitution: The word's substitution
+        :type  substitution: str
+        """
+        # The word and its substitution in each message format (normalized, case preserved, raw)
+        words = (normalize(word), normalize(word, preserve_case=True), word)
+        substitutions = (normalize(substitution), normalize(substitution, preserve_case=True), substitution)
+
+        # Make sure this substitution hasn't already been processed and add it to the substitution tables
+        added = False
+        for table, sub_word, sub in zip(self._substitutions, words, substitutions):
+            key = sub_word.lower()
+            if key and key not in table:
+                table[key] = sub
+                added = True
+
+        if added:
+            self._log.info('Appending new word substitution: "{word}" => "{sub}"'.format(word=words[0],
+                                                                                         sub=substitutions[0]))
+            # Rebuild the substitution expressions on next use, parsed messages and resolved redirect targets depend on
+            # them too
+            self._substitution_patterns = None
+            self._message_cache = OrderedDict()
+            self._static_redirects = {}
 
     # noinspection PyUnboundLocalVariable
     def parse_substitutions(self, messages):
         """
-        Parse substitutions in a supplied message
+        Parse substitutions in a supplied message. Every substitution is applied to each message format in a single
+        pass, so substituted text is never substituted again
         :param messages: A tuple messages being parsed (normalized, case preserved, raw)
         :type  messages: tuple of (str, str, str)
 
@@ -302,23 +953,61 @@ class AgentML:
         :rtype : tuple of (str, str, str)
         """
         # If no substitutions have been defined, just normalize the message
-        if not self._substitutions:
+        if not any(self._substitutions):
             self._log.info('No substitutions to process')
             return messages
 
         self._log.info('Processing message substitutions')
 
-        def substitute(sub_group, sub_message):
-            word, substitution = sub_group
-            return word.sub(substitution, sub_message)
+        # Compile a single expression matching every substituted word of each format, after substitutions change
+        patterns = self._substitution_patterns
+        if patterns is None:
+            patterns = self._substitution_patterns = tuple(compile_words(table, re.IGNORECASE)
+                                                           for table in self._substitutions)
+
+        def replace(table, match):
+            # Case-insensitive matching can accept text that lower() maps to a different key (a dotted capital I lowers
+            # to two characters), so leave any text without a substitution as it is
+            word = match.group(0)
+            return table.get(word.lower(), word)
 
-        normalized, preserve_case, raw = messages
-        for sub_normalized, sub_preserve_case, sub_raw in self._substitutions:
-            normalized = substitute(sub_normalized, normalized)
-            preserve_case = substitute(sub_preserve_case, preserve_case)
-            raw = substitute(sub_raw, raw)
+        def substitute(pattern, table, sub_message):
+            if pattern is None:
+                return sub_message
+            return pattern.sub(lambda match: replace(table, match), sub_message)
 
-        return normalized, preserve_case, raw
+        return tuple(substitute(pattern, table, message)
+                     for pattern, table, message in zip(patterns, self._substitutions, messages))
+
+    def parse_message(self, message):
+        """
+        Normalize a message and parse substitutions in it, reusing the result for recently parsed messages
+        :param message: The raw message
+        :type  message: str
+
+        :return: The substituted messages (normalized, case preserved, raw), followed by the words of the normalized
+            message, or None if its words aren't separated by single spaces
+        :rtype : tuple of (str, str, str, tuple or None)
+        """
+        # Keep a reference to the cache, so a message parsed while substitutions change is stored in the discarded one
+        cache = self._message_cache
+        with self._message_cache_lock:
+            parsed = cache.pop(message, None)
+            if parsed is not None:
+                cache[message] = parsed
+                return parsed
+
+        messages = self.parse_substitutions((normalize(message), normalize(message, preserve_case=True), message))
+        words = tuple(messages[0].split())
+        parsed = messages + (words if ' '.join(words) == messages[0] else None,)
+
+        if self.message_cache_size:
+            with self._message_cache_lock:
+                cache[message] = parsed
+                while len(cache) > self.message_cache_size:
+                    cache.popitem(last=False)
+
+        return parsed
 
     def get_var(self, name, user=None):
         """
@@ -347,6 +1036,34 @@ class AgentML:
 
         return self._global_vars[name]
 
+    def get_number(self, name, user=None):
+        """
+        Retrieve the numeric value of a global or user variable
+        :param name: The name of the variable to retrieve
+        :type  name: str
+
+        :param user: If retrieving a user variable, the user identifier
+        :type  user: str
+
+        :return: The value as a float, or None if it isn't numeric
+        :rtype : float or None
+
+        :raises UserNotDefinedError: The specified user does not exist
+        :raises VarNotDefinedError: The requested variable has not been defined
+        """
+        # Retrieve a user variable
+        if user is not None:
+            if user not in self._users:
+                raise UserNotDefinedError
+
+            return self._users[user].get_number(name)
+
+        # Retrieve a global variable
+        if name not in self._global_vars:
+            raise VarNotDefinedError
+
+        return self._global_vars.number(name)
+
     def set_var(self, name, value, user=None):
         """
         Set a global or user variable
@@ -446,6 +1163,33 @@ class AgentML:
         self._users[identifier] = User(identifier)
         return self._users[identifier]
 
+    def add_trace_hook(self, hook):
+        """
+        Register a hook to be notified when each stage of a request starts and ends
+        :param hook: The hook to register
+        :type  hook: agentml.tracing.TraceHook
+        """
+        self._log.info('Adding trace hook: {hook}'.format(hook=hook))
+        if self.tracer is None:
+            self.tracer = tracing.Tracer()
+
+        self.tracer.hooks.append(hook)
+
+    def remove_trace_hook(self, hook):
+        """
+        Remove a previously registered trace hook, disabling tracing entirely once no hooks remain
+        :param hook: The hook to remove
+        :type  hook: agentml.tracing.TraceHook
+        """
+        if self.tracer is None or hook not in self.tracer.hooks:
+            self._log.warn('Attempted to remove a trace hook that was never added: {hook}'.format(hook=hook))
+            return
+
+        self._log.info('Removing trace hook: {hook}'.format(hook=hook))
+        self.tracer.hooks.remove(hook)
+        if not self.tracer.hooks:
+            self.tracer = None
+
     def add_condition(self, name, cond_class):
         """
         Add a new custom condition type parser
@@ -466,6 +1210,7 @@ class AgentML:
             return
 
         self.conditions[name] = cond_class(name)
+        self.condition_generation += 1
 
     def set_tag(self, name, tag_class):
         """
@@ -505,7 +1250,7 @@ class AgentML:
             if head.strip():
                 head = newlines_to_spaces(head)
                 self._log.debug('Appending heading text: {text}'.format(text=head))
-            response.append(head)
+            response.append(self.intern(head))
 
         # Internal method for appending an elements tail to the response list
         def append_tail(e):
@@ -514,7 +1259,7 @@ class AgentML:
                 if tail.strip():
                     tail = newlines_to_spaces(tail)
                     self._log.debug('Appending trailing text: {text}'.format(text=tail))
-                response.append(tail)
+                response.append(self.intern(tail))
 
         # Parse the contained tags and add their associated string objects to the response list
         for child in element:
@@ -561,6 +1306,57 @@ class AgentML:
             print(reply, end='\n\n')
 
 
+class Context(object):
+    """
+    Request context object
+    """
+    def __init__(self, aml, user, message, groups, rng=None):
+        """
+        Initialize a new Context instance
+        :param aml: The parent AgentML instance
+        :type  aml: AgentML
+
+        :param user: The requesting user
+        :type  user: User
+
+        :param message: The request Message instance
+        :type  message: Message
+
+        :param groups: The request groups
+        :type  groups: set or AnyGroup
+
+        :param rng: The random number generator to use for this request, defaults to the AgentML instance generator
+        :type  rng: random.Random or None
+        """
+        self.aml = aml
+        self.user = user
+        self.message = message
+        self.groups = groups
+        self.rng = rng if rng is not None else aml.rng
+
+        # Redirects currently being resolved and the cached resolutions of redirects without side effects
+        self.redirects = []
+        self.redirect_cache = {}
+
+        # Condition type and variable values read during this request, including values retrieved in bulk by condition
+        # types that support prefetching. Writes made by reactions invalidate the values they change
+        self.reads = ReadCache()
+
+        # Counter of reactions (limits, variables and topic changes) applied during this request
+        self.effects = 0
+
+        # The logged response to this request
+        self.response = None
+
+    def add_effect(self):
+        """
+        Record that a reaction has been applied during this request. Cached redirect resolutions may depend on the state
+        that was changed, so they are discarded
+        """
+        self.effects += 1
+        self.redirect_cache.clear()
+
+
 class Message(object):
     """
     Message container object
@@ -587,14 +1383,15 @@ class Message(object):
         self._format = message_format
         self.aml = aml
 
-        # Parsed (and un-parsed) message containers
+        # Parsed (and un-parsed) message containers, and the words of the normalized message
         self._log.debug('Parsing raw message: {message}'.format(message=message))
-        messages = self.aml.parse_substitutions((normalize(message), normalize(message, preserve_case=True), message))
+        messages = self.aml.parse_message(message)
         self._messages = {
             'normalized_message': messages[0],
             'case_preserved_message': messages[1],
             'raw_message': messages[2]
         }
+        self.words = messages[3]
         self._log.debug('Normalized message processed: {msg}'.format(msg=self._messages['normalized_message']))
         self._log.debug('Case preserved message processed: {msg}'.format(msg=self._messages['case_preserved_message']))
         self._log.debug('Raw message processed: {msg}'.format(msg=self._messages['raw_message']))
@@ -661,7 +1458,7 @@ class User:
         # User attributes
         self.id = identifier
         self.topic = None
-        self._vars = {}
+        self._vars = VariableStore()
         self._limits = {}  # Dictionary of objects as keys, tuple of limit expiration's and blocking as values
 
     def get_var(self, name):
@@ -679,6 +1476,22 @@ class User:
 
         return self._vars[name]
 
+    def get_number(self, name):
+        """
+        Retrieve the numeric value of a variable assigned to this user
+        :param name: The name of the variable to retrieve
+        :type  name: str
+
+        :return: The value as a float, or None if it isn't numeric
+        :rtype : float or None
+
+        :raises VarNotDefinedError: The requested variable has not been defined
+        """
+        try:
+            return self._vars.number(name)
+        except KeyError:
+            raise VarNotDefinedError
+
     def set_var(self, name, value):
         """
         Set a variable for this user
@@ -1,9 +1,90 @@
 import re
 import random
+import threading
+from bisect import bisect_right
 from lxml import etree
 from six import string_types
 
 
+# Helper expressions used when normalizing messages and patterns
+MESSAGE_PUNCTUATION = re.compile(r'([^\s\w]|_)+')
+PATTERN_PUNCTUATION = re.compile(r'([^\s\w\(\)\[\]\|\*#])+')
+NEWLINE = re.compile(r'\s*\n\s*')
+
+# Compiled regular expressions shared across every trigger and AgentML instance, keyed by (source, flags)
+_pattern_cache = {}
+
+
+def compile_pattern(pattern, flags=0):
+    """
+    Compile a regular expression, reusing a previously compiled instance of the same pattern if one exists
+    :param pattern: The regular expression source
+    :type  pattern: str
+
+    :param flags: Regular expression flags
+    :type  flags: int
+
+    :rtype: _sre.SRE_Pattern
+
+    :raises sre_constants.error: The pattern is not a valid regular expression
+    """
+    key = (pattern, flags)
+    try:
+        return _pattern_cache[key]
+    except KeyError:
+        compiled = _pattern_cache[key] = re.compile(pattern, flags)
+        return compiled
+
+
+def compile_words(words, flags=0):
+    """
+    Compile a regular expression matching any of the specified words or phrases as a whole word. The alternatives are
+    merged into a character trie, so matching at each position of a string costs the length of the longest word
+    rather than the number of words
+    :param words: The words to match, empty words are ignored
+    :type  words: iterable of str
+
+    :param flags: Regular expression flags
+    :type  flags: int
+
+    :return: The compiled expression, or None if there are no words to match
+    :rtype : _sre.SRE_Pattern or None
+    """
+    root = {}
+    for word in words:
+        if not word:
+            continue
+
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = None
+
+    def trie_pattern(node):
+        alternatives = [re.escape(char) + trie_pattern(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+
+        if len(alternatives) == 1 and '' not in node:
+            return alternatives[0]
+
+        # Longer words are attempted first, shorter ones are only matched if they end on a word boundary
+        return '(?:{alternatives}){optional}'.format(alternatives='|'.join(alternatives),
+                                                     optional='?' if '' in node else '')
+
+    if not root:
+        return
+
+    return re.compile(r'\b(?:{trie})\b'.format(trie=trie_pattern(root)), flags)
+
+
+def clear_pattern_cache():
+    """
+    Discard all cached compiled patterns. Triggers that have already been loaded keep their compiled patterns
+    """
+    _pattern_cache.clear()
+
+
 def schema(relaxng):
     """
     Parse a RelaxNG schema document and return an etree instance of it
@@ -17,20 +98,380 @@ def schema(relaxng):
     return etree.RelaxNG(tree)
 
 
-def weighted_choice(choices):
+def element_schema(relaxng, define):
+    """
+    Parse a RelaxNG schema document and return an etree instance validating a single one of its definitions
+    :param relaxng: The RelaxNG schema as a string
+    :type  relaxng: str
+
+    :param define: The name of the definition to use as the start pattern
+    :type  define: str
+
+    :return: LXML etree RelaxNG instance
+    :rtype : etree.RelaxNG
+    """
+    tree = etree.fromstring(relaxng)
+    namespace = etree.QName(tree).namespace
+
+    start = tree.find('{{{ns}}}start'.format(ns=namespace))
+    start[:] = [etree.Element('{{{ns}}}ref'.format(ns=namespace), name=define)]
+    return etree.RelaxNG(tree)
+
+
+def weighted_choice(choices, rng=random):
     """
     Provides a weighted version of random.choice
     :param choices: A dictionary of choices, with the choice as the key and weight the value
     :type  choices: list of tuple of (str, int)
+
+    :param rng: The random number generator to use, defaults to the global random module
+    :type  rng: random.Random
+    """
+    return WeightedChoices(choices).choice(rng)
+
+
+class BatchedRandom(random.Random):
     """
-    total = sum(weight for choice, weight in choices)
-    rand = random.uniform(0, total)
-    most = 0
+    Random number generator that pre-draws its random numbers in batches for high volume use. A single instance may be
+    shared across threads: drawing from the batch and refilling it happen under a lock, so each pre-drawn number is
+    handed out exactly once
+    """
+    def __init__(self, seed=None, batch_size=1024):
+        """
+        Initialize a new Batched Random instance
+        :param seed: The initial seed, defaults to seeding from the system
+        :type  seed: int or None
+
+        :param batch_size: The number of random floats to draw at a time
+        :type  batch_size: int
+        """
+        self.batch_size = batch_size
+        self._batch = []
+        self._lock = threading.Lock()
+        super(BatchedRandom, self).__init__(seed)
+
+    def seed(self, *args, **kwargs):
+        """
+        Re-seed the generator and discard any pre-drawn numbers
+        """
+        with self._lock:
+            self._batch = []
+            super(BatchedRandom, self).seed(*args, **kwargs)
+
+    def random(self):
+        """
+        Return the next random float in the range [0.0, 1.0)
+        :rtype: float
+        """
+        with self._lock:
+            if not self._batch:
+                draw = super(BatchedRandom, self).random
+                self._batch = [draw() for _ in range(self.batch_size)]
+
+            return self._batch.pop()
+
+
+class TrackedRandom(random.Random):
+    """
+    Random number generator proxy that records whether any random numbers have been drawn from it. Every other method
+    of random.Random (choice, randint, shuffle, sample, ...) is built on random() or getrandbits(), so they all draw
+    from the wrapped generator too
+    """
+    def __init__(self, rng):
+        """
+        Initialize a new Tracked Random instance
+        :param rng: The random number generator to draw from
+        :type  rng: random.Random
+        """
+        # The inherited generator state is never drawn from, so skip seeding it from the system
+        super(TrackedRandom, self).__init__(0)
+        self.rng = rng
+        self.used = False
+
+    def random(self):
+        """
+        Return the next random float in the range [0.0, 1.0)
+        :rtype: float
+        """
+        self.used = True
+        return self.rng.random()
+
+    def getrandbits(self, k):
+        """
+        Return an integer with k random bits
+        :rtype: int
+        """
+        self.used = True
+        return self.rng.getrandbits(k)
+
+
+class WeightedChoices(object):
+    """
+    Precomputed cumulative weight table for repeated weighted random selections from a static set of choices
+    """
+    def __init__(self, choices):
+        """
+        Initialize a new Weighted Choices table
+        :param choices: A list of choices paired with their weights
+        :type  choices: list of tuple of (str, int)
+        """
+        self.choices = []
+        self._cumulative = []
+        self.total = 0
+
+        for choice, weight in choices:
+            self.total += weight
+            self.choices.append(choice)
+            self._cumulative.append(self.total)
+
+    def choice(self, rng=random):
+        """
+        Retrieve a random weighted choice
+        :param rng: The random number generator to use, defaults to the global random module
+        :type  rng: random.Random
+
+        :return: The selected choice, or None if there are no choices with a positive weight
+        """
+        if self.total <= 0:
+            return
+
+        if len(self.choices) == 1:
+            return self.choices[0]
+
+        index = bisect_right(self._cumulative, rng.random() * self.total)
+        return self.choices[min(index, len(self.choices) - 1)]
+
+    def __len__(self):
+        return len(self.choices)
+
+
+class WeightedSampler(object):
+    """
+    Weighted random sampling without replacement, backed by a binary indexed tree so that both selecting and
+    removing a choice take O(log n) time
+    """
+    def __init__(self, choices):
+        """
+        Initialize a new Weighted Sampler
+        :param choices: A list of choices paired with their weights
+        :type  choices: list of tuple of (str, int)
+        """
+        self.choices = []
+        self._weights = []
+        self.total = 0
+
+        for choice, weight in choices:
+            weight = max(weight, 0)
+            self.total += weight
+            self.choices.append(choice)
+            self._weights.append(weight)
+
+        # Build the tree in O(n)
+        size = len(self._weights)
+        self._tree = [0] + self._weights
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                self._tree[parent] += self._tree[index]
+
+        self._remaining = sum(1 for weight in self._weights if weight)
+
+        self._step = 1
+        while self._step * 2 <= size:
+            self._step *= 2
+
+    def pop(self, rng=random):
+        """
+        Select a random weighted choice and remove it from the sampler
+        :param rng: The random number generator to use, defaults to the global random module
+        :type  rng: random.Random
+
+        :return: The selected choice, or None if there are no remaining choices with a positive weight
+        """
+        if self.total <= 0:
+            return
+
+        # Descend the tree to locate the first choice whose cumulative weight exceeds our random number. If only one
+        # choice remains, there is nothing to draw
+        size = len(self._weights)
+        rand = rng.random() * self.total if self._remaining > 1 else 0
+        index = 0
+        step = self._step if size else 0
+
+        while step:
+            next_index = index + step
+            if next_index <= size and self._tree[next_index] <= rand:
+                index = next_index
+                rand -= self._tree[next_index]
+            step //= 2
+
+        # Guard against floating point rounding carrying us past the last available choice
+        index = min(index, size - 1)
+        while not self._weights[index]:
+            index -= 1
+
+        # Remove the selected choice
+        weight = self._weights[index]
+        self._weights[index] = 0
+        self.total -= weight
+        self._remaining -= 1
+
+        position = index + 1
+        while position <= size:
+            self._tree[position] -= weight
+            position += position & -position
+
+        return self.choices[index]
+
+    def __len__(self):
+        return self._remaining
+
+
+def to_number(value):
+    """
+    Parse a numeric value
+    :param value: The value to parse
+    :type  value: str, int, float or None
+
+    :return: The value as a float, or None if it isn't numeric
+    :rtype : float or None
+    """
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return
+
+
+class VariableStore(dict):
+    """
+    Variable dictionary that keeps a parsed numeric copy of every value alongside it, so numeric comparisons don't
+    need to parse the value again every time it is read
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize a new Variable Store
+        """
+        super(VariableStore, self).__init__()
+        self._numbers = {}  # Values paired with their numeric form, keyed by name
+        self.update(*args, **kwargs)
+
+    def number(self, name):
+        """
+        Retrieve the numeric value of a variable
+        :param name: The name of the variable
+        :type  name: str
+
+        :return: The value as a float, or None if it isn't numeric
+        :rtype : float or None
+
+        :raises KeyError: The variable has not been defined
+        """
+        value = self[name]
+
+        # Values written without going through __setitem__ (e.g. by update) are parsed the first time they're read
+        shadow = self._numbers.get(name)
+        if shadow is None or shadow[0] is not value:
+            shadow = self._numbers[name] = (value, to_number(value))
+
+        return shadow[1]
+
+    def __setitem__(self, name, value):
+        super(VariableStore, self).__setitem__(name, value)
+        self._numbers[name] = (value, to_number(value))
+
+    def __delitem__(self, name):
+        super(VariableStore, self).__delitem__(name)
+        self._numbers.pop(name, None)
+
+    def clear(self):
+        super(VariableStore, self).clear()
+        self._numbers.clear()
+
+
+class ReadCache(dict):
+    """
+    Per-request cache of condition type reads, keyed by (condition type name, key). The numeric forms of values read
+    through ConditionType.get_number are cached under (condition type name, key, float)
+    """
+    # Condition types whose values only change when the matching variable or topic is written. Any other type may
+    # depend on any state, so its values are discarded on every write
+    PRECISE_TYPES = frozenset(['user', 'user_var', 'global_var', 'topic'])
+
+    def read(self, cond_type, type_name, agentml, user, key):
+        """
+        Retrieve the value of a condition type, evaluating it only if it has not been read yet
+        :param cond_type: The condition type
+        :type  cond_type: agentml.parser.trigger.condition.types.ConditionType
+
+        :param type_name: The name the condition type is registered under
+        :type  type_name: str
+
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param key: The types key (if relevant)
+        :type  key: str or None
+
+        :return: Current value of the condition type
+        """
+        entry = (type_name, key)
+        try:
+            return self[entry]
+        except KeyError:
+            value = self[entry] = cond_type.get(agentml, user, key)
+            return value
+
+    def read_number(self, cond_type, type_name, agentml, user, key):
+        """
+        Retrieve the numeric value of a condition type, evaluating it only if it has not been read yet
+        :param cond_type: The condition type
+        :type  cond_type: agentml.parser.trigger.condition.types.ConditionType
+
+        :param type_name: The name the condition type is registered under
+        :type  type_name: str
+
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param key: The types key (if relevant)
+        :type  key: str or None
+
+        :return: Current value of the condition type as a float, or None if it isn't numeric
+        :rtype : float or None
+        """
+        entry = (type_name, key, float)
+        try:
+            return self[entry]
+        except KeyError:
+            pass
+
+        # Parse values that have already been read rather than evaluating the condition type again
+        if not cond_type.typed and (type_name, key) in self:
+            number = self[entry] = to_number(self[(type_name, key)])
+        else:
+            number = self[entry] = cond_type.get_number(agentml, user, key)
+
+        return number
+
+    def invalidate(self, type_name, key=None):
+        """
+        Discard the values made stale by a write
+        :param type_name: The condition type whose value was written
+        :type  type_name: str
 
-    for choice, weight in choices:
-        if most + weight > rand:
-            return choice
-        most += weight
+        :param key: The key that was written, or None if every key of the type may have changed
+        :type  key: str or None
+        """
+        stale = [entry for entry in self if entry[0] not in self.PRECISE_TYPES or
+                 (entry[0] == type_name and (key is None or entry[1] == key))]
+        for entry in stale:
+            del self[entry]
 
 
 def normalize(string, pattern=False, preserve_case=False):
@@ -47,7 +488,7 @@ def normalize(string, pattern=False, preserve_case=False):
 
     :rtype: str
     """
-    regex = re.compile(r'([^\s\w\(\)\[\]\|\*#])+') if pattern else re.compile(r'([^\s\w]|_)+')
+    regex = PATTERN_PUNCTUATION if pattern else MESSAGE_PUNCTUATION
 
     if not isinstance(string, string_types):
         return ''
@@ -191,5 +632,4 @@ def newlines_to_spaces(text):
     :param text: The text to parse
     :type  text: str
     """
-    newline_pattern = re.compile('\s*\n\s*')
-    return newline_pattern.sub(' ', text)
+    return NEWLINE.sub(' ', text)
@@ -1,5 +1,10 @@
+import json
 import logging
-from collections import deque
+import threading
+from collections import deque, namedtuple
+from itertools import count
+from time import time
+from agentml.constants import AnyGroup
 
 
 class InternalLogger(object):
@@ -11,11 +16,42 @@ class InternalLogger(object):
         """
         self._max_entries = max_entries
         self._log_entries = deque(maxlen=self._max_entries)
+        self._ids = count(1)
+        self.sinks = []
         self._debug_log = logging.getLogger('agentml.logger')
 
     def add(self, *args, **kwargs):
         raise NotImplementedError('This logger class has not implemented support for adding log entries')
 
+    def _store(self, entry):
+        """
+        Store a log entry and pass it on to any export sinks
+        :param entry: The log entry
+        :type  entry: Request or Response
+        """
+        self._log_entries.appendleft(entry)
+        for sink in self.sinks:
+            sink.write(entry)
+
+    def add_sink(self, sink):
+        """
+        Export all log entries added from now on to a sink
+        :param sink: The export sink
+        :type  sink: JsonLinesSink
+        """
+        self._debug_log.info('Adding log export sink: {sink}'.format(sink=sink))
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        """
+        Stop exporting log entries to a sink. The sink is flushed, but not closed
+        :param sink: The export sink
+        :type  sink: JsonLinesSink
+        """
+        self._debug_log.info('Removing log export sink: {sink}'.format(sink=sink))
+        self.sinks.remove(sink)
+        sink.flush()
+
     @property
     def entries(self):
         """
@@ -62,7 +98,8 @@ class InternalLogger(object):
         Removes the maximum entry limit
         """
         self._debug_log.info('Removing maximum entries restriction')
-        self._log_entries(deque(self._log_entries))
+        self._max_entries = None
+        self._log_entries = deque(self._log_entries)
 
 
 ###############
@@ -78,9 +115,9 @@ class RequestLogger(InternalLogger):
         super(RequestLogger, self).__init__(max_entries)
         self._debug_log = logging.getLogger('agentml.logger.requests')
 
-    def add(self, user, message, groups):
+    def record(self, user, message, groups):
         """
-        Add a new log entry
+        Create a new Request record without logging it. Requests are logged once their response is known
         :param user: The requesting user
         :type  user: agentml.User
 
@@ -88,41 +125,55 @@ class RequestLogger(InternalLogger):
         :type  message: agentml.Message
 
         :param groups: The request groups
-        :type  groups: set
+        :type  groups: set or AnyGroup
 
-        :return: The logged Request instance
-        :rtype : Request
+        :rtype: Request
         """
-        self._debug_log.debug('Logging new Request entry')
-        request = Request(user, message, groups)
-        self._log_entries.appendleft(request)
-        return request
+        groups = groups if groups is AnyGroup else frozenset(groups)
+        return Request(next(self._ids), time(), user.id, message.normalized, groups, None)
 
+    def add(self, request, response=None):
+        """
+        Add a new log entry
+        :param request: The Request record
+        :type  request: Request
 
-class Request:
-    def __init__(self, user, message, groups, response=None):
+        :param response: The logged Response to this Request, if a response was returned
+        :type  response: Response or None
+
+        :return: The logged Request record
+        :rtype : Request
         """
-        Initialize a new log Request instance
-        :param user: The requesting user
-        :type  user: agentml.User
+        self._debug_log.debug('Logging new Request entry')
+        if response is not None:
+            request = request._replace(response=response)
 
-        :param message: The request message
-        :type  message: agentml.Message or basestring
+        self._store(request)
+        return request
 
-        :param groups: The request groups
-        :type  groups: set
 
-        :param response: The Response associated with this Request
-        :type  response: Response or None
-        """
-        self.user = user
-        self.message = message
-        self.groups = groups
-        self.response = response
+class Request(namedtuple('Request', 'id timestamp user_id message groups response')):
+    """
+    Immutable request log record. User and message instances are not retained, only the user ID and the normalized
+    message text
+    """
+    __slots__ = ()
 
     def __str__(self):
         return self.message
 
+    def as_dict(self):
+        """
+        Return the record as a JSON serializable dictionary
+        :rtype: dict
+        """
+        return {
+            'type': 'request', 'id': self.id, 'timestamp': self.timestamp, 'user_id': self.user_id,
+            'message': self.message,
+            'groups': '*' if self.groups is AnyGroup else sorted(self.groups, key=lambda group: group or ''),
+            'response_id': self.response.id if self.response else None
+        }
+
 
 ###############
 # Responses   #
@@ -137,36 +188,116 @@ class ResponseLogger(InternalLogger):
         super(ResponseLogger, self).__init__(max_entries)
         self._debug_log = logging.getLogger('agentml.logger.responses')
 
-    def add(self, message, request):
+    def add(self, message, request, trigger=None):
         """
         Add a new log entry
-        :param message: The request message
+        :param message: The response message
         :type  message: str
 
-        :param request: The Request associated with this response
+        :param request: The Request record associated with this response
         :type  request: Request or None
 
-        :return: The logged Response instance
+        :param trigger: The ID of the Trigger that was matched
+        :type  trigger: str or None
+
+        :return: The logged Response record
         :rtype : Response
         """
         self._debug_log.debug('Logging new Response entry')
-        response = Response(message, request)
-        self._log_entries.appendleft(response)
+        response = Response(next(self._ids), time(), message, trigger, request)
+        self._store(response)
         return response
 
 
-class Response:
-    def __init__(self, message, request=None):
+class Response(namedtuple('Response', 'id timestamp message trigger request')):
+    """
+    Immutable response log record
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.message
+
+    def as_dict(self):
         """
-        Initialize a new log Request instance
-        :param message: The response message
-        :type  message: str
+        Return the record as a JSON serializable dictionary
+        :rtype: dict
+        """
+        return {
+            'type': 'response', 'id': self.id, 'timestamp': self.timestamp, 'message': self.message,
+            'trigger': self.trigger, 'request_id': self.request.id if self.request else None
+        }
 
-        :param request: The Request associated with this Response
-        :type  request: Request or None
+
+###############
+# Export      #
+###############
+class JsonLinesSink(object):
+    """
+    Exports log records to a file as JSON lines, writing them in batches
+    """
+    def __init__(self, path, batch_size=100, flush_interval=5.0):
         """
-        self.message = message
-        self.request = request
+        Initialize a new JSON Lines Sink instance
+        :param path: The path of the file to append records to
+        :type  path: str
 
-    def __str__(self):
-        return self.message
+        :param batch_size: The number of records to buffer before writing them out
+        :type  batch_size: int
+
+        :param flush_interval: The maximum number of seconds a record may remain buffered, checked as records are added
+        :type  flush_interval: float or None
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._buffered_at = None
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+        self._debug_log = logging.getLogger('agentml.logger.export')
+
+    def write(self, record):
+        """
+        Buffer a record for export
+        :param record: The log record
+        :type  record: Request or Response
+        """
+        line = json.dumps(record.as_dict(), sort_keys=True)
+
+        with self._lock:
+            if not self._buffer:
+                self._buffered_at = time()
+            self._buffer.append(line)
+
+            expired = self.flush_interval is not None and time() - self._buffered_at >= self.flush_interval
+            if len(self._buffer) >= self.batch_size or expired:
+                self._flush()
+
+    def flush(self):
+        """
+        Write out all buffered records
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write out all buffered records, the lock must already be held
+        """
+        if not self._buffer:
+            return
+
+        self._debug_log.debug('Exporting {num} log records to {path}'.format(num=len(self._buffer), path=self.path))
+        self._file.write('\n'.join(self._buffer) + '\n')
+        self._file.flush()
+        self._buffer = []
+
+    def close(self):
+        """
+        Write out all buffered records and close the file
+        """
+        with self._lock:
+            self._flush()
+            self._file.close()
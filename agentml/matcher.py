@@ -0,0 +1,281 @@
+"""
+Token trie pattern matcher
+
+An alternate matching engine, enabled with AgentML(matcher='trie'). Every pattern written in the AgentML wildcard
+dialect is compiled into a single trie over the words of the normalized message, with wildcard edges that consume
+whole words. Walking a message through the trie visits each of its words once per active trie node, no matter how many
+triggers are loaded, and yields every trigger whose pattern can match the message.
+
+The trie only narrows down the triggers that are attempted. Candidates are still attempted in sorted order, and each
+one still tests its own pattern, so ordering, star captures and everything else about matching behaves exactly as it
+does with the default regex engine. Patterns the trie can't represent faithfully (raw regular expressions, wildcards
+joined to words, optionals next to wildcards or choices, ...) are attempted against every message, as are all triggers
+when the message isn't a sequence of words separated by single spaces.
+"""
+import re
+from heapq import merge
+from itertools import product
+
+# Pattern elements, separated by single spaces: required choices, optional choices and words / wildcard symbols
+ELEMENT = re.compile(r'\((?P<choice>[^()\[\]]*)\)|\[(?P<optional>[^()\[\]]*)\]|(?P<token>[^\s()\[\]]+)')
+
+# Plain words, and choice options made of one or more plain words
+WORD = re.compile(r'^[^\W_]+$', re.UNICODE)
+PHRASE = re.compile(r'^[^\W_]+(?: [^\W_]+)*$', re.UNICODE)
+
+# Whole word wildcard symbols
+STAR = '*'
+DIGITS = '#'
+LETTERS = '_'
+WILDCARDS = (STAR, DIGITS, LETTERS)
+
+# Joins the words on either side of an omitted optional, since "a [x] b" also matches "ab"
+GLUE = object()
+
+
+class Node(object):
+    """
+    A single node in the token trie
+    """
+    __slots__ = ('words', 'digits', 'letters', 'star', 'repeat', 'triggers')
+
+    def __init__(self, repeat=False):
+        """
+        Initialize a new Node instance
+        :param repeat: Whether this node can consume any number of additional words (i.e. it follows a * wildcard)
+        :type  repeat: bool
+        """
+        self.words = {}
+        self.digits = None
+        self.letters = None
+        self.star = None
+        self.repeat = repeat
+        self.triggers = []
+
+    def child(self, token):
+        """
+        Retrieve the child reached by a pattern token, creating it if necessary
+        :param token: A word or wildcard symbol
+        :type  token: str
+
+        :rtype: Node
+        """
+        if token == STAR:
+            self.star = self.star or Node(repeat=True)
+            return self.star
+
+        if token == DIGITS:
+            self.digits = self.digits or Node()
+            return self.digits
+
+        if token == LETTERS:
+            self.letters = self.letters or Node()
+            return self.letters
+
+        if token not in self.words:
+            self.words[token] = Node()
+        return self.words[token]
+
+
+class TokenTrie(object):
+    """
+    Compiles trigger patterns into a token trie and retrieves the triggers that may match a message
+    """
+    # The maximum number of word sequences a single pattern's choices may expand into
+    MAX_EXPANSIONS = 64
+
+    def __init__(self):
+        """
+        Initialize a new Token Trie instance
+        """
+        self.root = Node()
+        self.fallback = []  # (order, trigger) of triggers that are attempted against every message
+        self.compiled = 0
+        self._order = 0
+
+    def add(self, trigger, pattern):
+        """
+        Add a trigger. Triggers must be added in the order they are attempted in
+        :param trigger: The trigger
+        :type  trigger: agentml.parser.trigger.Trigger
+
+        :param pattern: The trigger's normalized pattern, or None if the pattern is a raw regular expression
+        :type  pattern: str or None
+
+        :return: True if the pattern was compiled into the trie, False if the trigger is attempted against every message
+        :rtype : bool
+        """
+        entry = (self._order, trigger)
+        self._order += 1
+
+        sequences = self.expand(pattern) if pattern is not None else None
+        if sequences is None:
+            self.fallback.append(entry)
+            return False
+
+        terminals = set()
+        for sequence in sequences:
+            node = self.root
+            for token in sequence:
+                node = node.child(token)
+            terminals.add(node)
+
+        for node in terminals:
+            node.triggers.append(entry)
+
+        self.compiled += 1
+        return True
+
+    @classmethod
+    def parse(cls, pattern):
+        """
+        Split a normalized pattern into its elements
+        :param pattern: The normalized pattern
+        :type  pattern: str
+
+        :return: A list of words / wildcard symbols, ('choice', options) and ('optional', options) elements, or None if
+            the pattern can't be represented in the trie
+        :rtype : list or None
+        """
+        elements = []
+        position = 0
+
+        while True:
+            match = ELEMENT.match(pattern, position)
+            if not match:
+                return
+
+            choice, optional, token = match.group('choice', 'optional', 'token')
+            if token is not None:
+                if token not in WILDCARDS and not WORD.match(token):
+                    return
+                elements.append(token)
+            elif choice in WILDCARDS:
+                # Captured wildcards
+                elements.append(choice)
+            else:
+                options = (choice if optional is None else optional).split('|')
+                if not all(PHRASE.match(option) for option in options):
+                    return
+                elements.append(('choice' if optional is None else 'optional', [o.split(' ') for o in options]))
+
+            # Elements must be separated by exactly one space
+            position = match.end()
+            if position == len(pattern):
+                return elements
+
+            if pattern[position] != ' ':
+                return
+            position += 1
+
+    @classmethod
+    def expand(cls, pattern):
+        """
+        Expand a normalized pattern into the token sequences it matches
+        :param pattern: The normalized pattern
+        :type  pattern: str
+
+        :return: The token sequences, or None if the pattern can't be represented in the trie
+        :rtype : list of tuple or None
+        """
+        elements = cls.parse(pattern)
+        if not elements:
+            return
+
+        alternatives = []
+        for index, element in enumerate(elements):
+            if not isinstance(element, tuple):
+                alternatives.append([(element,)])
+                continue
+
+            kind, options = element
+            if kind == 'choice':
+                alternatives.append([tuple(option) for option in options])
+                continue
+
+            # Optionals swallow the spaces around them, so they can only be represented next to plain words
+            before = elements[index - 1] if index else None
+            after = elements[index + 1] if index + 1 < len(elements) else None
+            if not all(e is None or (not isinstance(e, tuple) and e not in WILDCARDS) for e in (before, after)):
+                return
+
+            omitted = [(GLUE,), ()] if before and after else [()]
+            alternatives.append([tuple(option) for option in options] + omitted)
+
+        count = 1
+        for options in alternatives:
+            count *= len(options)
+        if count > cls.MAX_EXPANSIONS:
+            return
+
+        sequences = []
+        for combination in product(*alternatives):
+            sequence = []
+            glue = False
+            for token in (token for tokens in combination for token in tokens):
+                if token is GLUE:
+                    glue = True
+                elif glue:
+                    sequence[-1] += token
+                    glue = False
+                else:
+                    sequence.append(token)
+            sequences.append(tuple(sequence))
+
+        return sequences
+
+    def match(self, message):
+        """
+        Retrieve the compiled triggers whose patterns may match a message
+        :param message: The normalized message, split into words
+        :type  message: list of str
+
+        :return: (order, trigger) entries, unordered
+        :rtype : set of tuple
+        """
+        active = {self.root}
+        for word in message:
+            digits = word.isdigit()
+            letters = word.isalpha()
+            reached = set()
+
+            for node in active:
+                if node.words:
+                    child = node.words.get(word)
+                    if child is not None:
+                        reached.add(child)
+                if digits and node.digits is not None:
+                    reached.add(node.digits)
+                if letters and node.letters is not None:
+                    reached.add(node.letters)
+                if node.star is not None:
+                    reached.add(node.star)
+                if node.repeat:
+                    reached.add(node)
+
+            if not reached:
+                return set()
+            active = reached
+
+        return set(entry for node in active for entry in node.triggers)
+
+    def candidates(self, message, words=None):
+        """
+        Retrieve every trigger that may match a message, in the order they are attempted
+        :param message: The normalized message
+        :type  message: str
+
+        :param words: The words of the message, if it is already known to be words separated by single spaces
+        :type  words: tuple of str or None
+
+        :return: The triggers, or None if every trigger may match the message
+        :rtype : list of agentml.parser.trigger.Trigger or None
+        """
+        if words is None:
+            words = message.split()
+
+            # Wildcards can match runs of whitespace the trie doesn't know about
+            if ' '.join(words) != message:
+                return
+
+        return [trigger for order, trigger in merge(sorted(self.match(words)), self.fallback)]
@@ -1 +1 @@
-from agentml.parser.element import Element, Restrictable
+from agentml.parser.element import Element, Restrictable, ParserMeta, parse_children
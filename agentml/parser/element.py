@@ -1,8 +1,47 @@
 import logging
+from abc import ABCMeta
+from six import add_metaclass
 from lxml import etree
 from agentml.common import attribute, bool_attribute
 
 
+class ParserMeta(ABCMeta):
+    """
+    Metaclass of classes parsed from XML elements. Builds a table of the class's _parse_<tag> methods keyed by tag when
+    the class is created, so child elements are dispatched with a single dictionary lookup. The methods of tags listed
+    in the class's DEFERRED attribute are also split out into separate tables, so they can be parsed later on
+    """
+    def __init__(cls, name, bases, namespace):
+        super(ParserMeta, cls).__init__(name, bases, namespace)
+        cls._parsers = dict((attr[len('_parse_'):], getattr(cls, attr))
+                            for attr in dir(cls) if attr.startswith('_parse_'))
+
+        deferred = getattr(cls, 'DEFERRED', ())
+        cls._eager_parsers = dict((tag, parse) for tag, parse in cls._parsers.items() if tag not in deferred)
+        cls._deferred_parsers = dict((tag, parse) for tag, parse in cls._parsers.items() if tag in deferred)
+
+
+def parse_children(parser, element, parsers=None):
+    """
+    Loop through all child elements and execute any available parse methods for them
+    :param parser: The object being parsed, an instance of a ParserMeta class
+    :type  parser: object
+
+    :param element: The XML Element object
+    :type  element: etree._Element
+
+    :param parsers: The parse methods to use keyed by tag, defaults to all of the parser's parse methods
+    :type  parsers: dict or None
+    """
+    parsers = parser._parsers if parsers is None else parsers
+    for child in element:
+        # Comments and processing instructions have no tag name, so they never have a parse method
+        parse = parsers.get(child.tag)
+        if parse is not None:
+            parse(parser, child)
+
+
+@add_metaclass(ParserMeta)
 class Element(object):
     """
     Base AgentML element class
@@ -30,12 +69,7 @@ class Element(object):
         """
         Loop through all child elements and execute any available parse methods for them
         """
-        for child in self._element:
-            method_name = '_parse_{0}'.format(str(child.tag))  # TODO: This is a hack, skip comment objects here
-
-            if hasattr(self, method_name):
-                parse = getattr(self, method_name)
-                parse(child)
+        parse_children(self, self._element)
 
 
 class Restrictable(object):
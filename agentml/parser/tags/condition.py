@@ -38,4 +38,5 @@ class Condition(Tag, BaseCondition):
         """
         Return the current evaluation of a condition statement
         """
-        return ''.join(map(str, self.evaluate(self.trigger.user)))
+        context = self.agentml.context
+        return ''.join(map(str, self.evaluate(self.trigger.user, context.reads if context else None)))
@@ -1,6 +1,6 @@
 import os
 import logging
-from agentml.common import schema, int_attribute, weighted_choice
+from agentml.common import schema, int_attribute, WeightedChoices
 from agentml.parser.tags import Tag
 
 
@@ -15,6 +15,7 @@ class Random(Tag):
         :type  element: etree._Element
         """
         self._responses = ()
+        self._choices = WeightedChoices(())
         super(Random, self).__init__(trigger, element)
 
         # Define our schema
@@ -35,18 +36,25 @@ class Random(Tag):
 
             # If the random element doesn't contain any tags, just store the text and return
             if not len(child):
-                responses.append((child.text, weight))
+                responses.append((self.trigger.agentml.intern(child.text), weight))
                 continue
 
             # Otherwise, parse all the available tags
             responses.append((tuple(self.trigger.agentml.parse_tags(child, self.trigger)), weight))
         self._responses = tuple(responses)
 
+        # Random elements containing nothing but text can share their choices with every identical random element
+        if all(not isinstance(response, tuple) for response, weight in self._responses):
+            self._responses = self.trigger.agentml.intern(self._responses)
+            self._choices = self.trigger.agentml.intern(self._responses, WeightedChoices)
+        else:
+            self._choices = WeightedChoices(self._responses)
+
     def value(self):
         """
         Fetch a random weighted choice
         """
-        choice = weighted_choice(self._responses)
+        choice = self._choices.choice(self.trigger.agentml.get_rng())
 
         # If the choice is a tuple, join the elements into a single mapped string
         if isinstance(choice, tuple):
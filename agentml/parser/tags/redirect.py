@@ -21,13 +21,14 @@ class Redirect(Tag):
         with open(os.path.join(self.trigger.agentml.script_path, 'schemas', 'tags', 'redirect.rng')) as file:
             self.schema = schema(file.read())
 
+        # Literal redirects always request the same message, so their targets can be resolved ahead of time
+        if not len(self._element) and self._element.text:
+            self.trigger.agentml.add_redirect_target(self._element.text)
+
     def value(self):
         """
         Return the value of the redirect response
         """
-        user = self.trigger.agentml.request_log.most_recent().user
-        groups = self.trigger.agentml.request_log.most_recent().groups
-
         # Does the redirect statement have tags to parse?
         if len(self._element):
             message = ''.join(map(str, self.trigger.agentml.parse_tags(self._element, self.trigger)))
@@ -36,6 +37,6 @@ class Redirect(Tag):
 
         # Is there a default value defined?
         default = attribute(self._element, 'default', '')
-        response = self.trigger.agentml.get_reply(user.id, message, groups)
+        response = self.trigger.agentml.resolve_redirect(message)
 
         return response or default
@@ -1,9 +1,10 @@
 import logging
 from six import add_metaclass
-from abc import ABCMeta, abstractmethod
+from abc import abstractmethod
+from agentml.parser.element import ParserMeta, parse_children
 
 
-@add_metaclass(ABCMeta)
+@add_metaclass(ParserMeta)
 class Tag(object):
     """
     Tag base class
@@ -27,12 +28,7 @@ class Tag(object):
         """
         Loop through all child elements and execute any available parse methods for them
         """
-        for child in self._element:
-            method_name = '_parse_{0}'.format(str(child.tag))  # TODO: This is a hack, skip comment objects here
-
-            if hasattr(self, method_name):
-                parse = getattr(self, method_name)
-                parse(child)
+        parse_children(self, self._element)
 
     @property
     def schema(self):
@@ -38,12 +38,22 @@ class Var(Tag):
         # Is there a default value defined?
         default = attribute(self._element, 'default')
 
+        # Variables read earlier in this request are cached alongside the values read by condition statements
+        context = self.trigger.agentml.context
+        entry = ('user_var' if self.type == 'user' else 'global_var', var)
+        if context and context.reads.get(entry) is not None:
+            return context.reads[entry]
+
         try:
             self._log.debug('Retrieving {type} variable {var}'.format(type=self.type, var=var))
             if self.type == 'user':
-                return self.trigger.user.get_var(var)
+                value = self.trigger.user.get_var(var)
             else:
-                return self.trigger.agentml.get_var(var)
+                value = self.trigger.agentml.get_var(var)
+
+            if context:
+                context.reads[entry] = value
+            return value
         except VarNotDefinedError:
             # Do we have a default value?
             if default:
@@ -1,21 +1,44 @@
 import logging
 import re
 import sre_constants
-import random
 from time import time
+from timeit import default_timer
 from collections import Iterable
 from six import string_types
-from agentml.parser import Element, Restrictable
-from agentml.common import normalize, int_attribute, bool_attribute, bool_element
-from agentml.errors import AgentMLSyntaxError, ParserBlockingError, LimitError, ChanceError
+from agentml.parser import Element, Restrictable, parse_children
+from agentml.common import normalize, compile_pattern, int_attribute, bool_attribute, bool_element
+from agentml.tracing import MATCH, SELECT
+from agentml.errors import AgentMLError, AgentMLSyntaxError, ParserBlockingError, LimitError, ChanceError
 from agentml.parser.trigger.response import Response, ResponseContainer
 from agentml.parser.trigger.condition import Condition
 
 
+# Wildcard symbols and the regular expressions they're replaced with
+WILDCARD_REPLACEMENTS = [
+    (re.compile(r'(?<!\\)\(\*\)'), r'(.+)'),
+    (re.compile(r'(?<!\\)\*'),     r'(?:.+)'),
+    (re.compile(r'(?<!\\)\(#\)'),  r'(\d+)'),
+    (re.compile(r'(?<!\\)#'),      r'(?:\d+)'),
+    (re.compile(r'(?<!\\)\(_\)'),  r'([a-zA-Z]+)'),
+    (re.compile(r'(?<!\\)_'),      r'(?:[a-zA-Z]+)'),
+]
+
+# Required and optional choices
+REQUIRED_CHOICE = re.compile(r'\(([\w\s\|]+)\)')
+OPTIONAL_CHOICE = re.compile(r'\s?\[([\w\s\|]+)\]\s?')
+
+# Words counted towards a pattern's sort order
+PATTERN_WORD = re.compile(r'(\b(?<![\(\)\[\]\|])\w\w*\b(?![\(\)\[\]\|]))', re.IGNORECASE)
+
+
 class Trigger(Element, Restrictable):
     """
     AgentML Trigger object
     """
+    # Child elements that aren't needed to sort and match the trigger. When loading lazily, they are only parsed the
+    # first time the trigger's responses are needed
+    DEFERRED = frozenset(['response', 'template', 'redirect', 'condition', 'var'])
+
     def __init__(self, agentml, element, file_path, **kwargs):
         """
         Initialize a new Trigger instance
@@ -31,6 +54,7 @@ class Trigger(Element, Restrictable):
         :param kwargs: Default attributes
         """
         # Containers and default attributes
+        self.id = '{path}:{line}'.format(path=file_path, line=element.sourceline)
         self.priority = int_attribute(element, 'priority')
         self.normalize = bool_attribute(element, 'normalize')
         self.blocking = bool_element(element, 'blocking')
@@ -42,10 +66,14 @@ class Trigger(Element, Restrictable):
         self.vars = []  # list of tuple(type, name, value)
 
         # Pattern metadata
+        self.pattern_text = None  # The normalized pattern, before it's compiled (None for raw regular expressions)
         self.pattern_is_atomic = False
         self.pattern_words = 0
         self.pattern_len = 0
 
+        # Whether the deferred child elements have been parsed
+        self.materialized = True
+
         # Temporary response data
         self.stars = {
             'normalized': (),
@@ -60,6 +88,47 @@ class Trigger(Element, Restrictable):
 
         self._log = logging.getLogger('agentml.parser.trigger')
 
+    def _parse(self):
+        """
+        Loop through all child elements and execute any available parse methods for them, deferring the elements that
+        build responses when loading lazily
+        """
+        if not self.agentml.lazy:
+            return parse_children(self, self._element)
+
+        self.materialized = False
+        parse_children(self, self._element, self._eager_parsers)
+
+    def materialize(self):
+        """
+        Parse the deferred child elements of a lazily loaded trigger
+        """
+        with self.agentml.lazy_lock:
+            if self.materialized:
+                return
+
+            self._log.info('Materializing lazily loaded Trigger: {id}'.format(id=self.id))
+            try:
+                parse_children(self, self._element, self._deferred_parsers)
+            except AgentMLError:
+                self._log.warn('Unable to build the responses of lazily loaded Trigger {id}, the Trigger will not '
+                               'respond'.format(id=self.id), exc_info=True)
+                self._responses = ResponseContainer()
+                self.vars = []
+
+            self.materialized = True
+
+    @property
+    def responses(self):
+        """
+        The trigger's responses, built first if the trigger was loaded lazily
+        :rtype: ResponseContainer
+        """
+        if not self.materialized:
+            self.materialize()
+
+        return self._responses
+
     def match(self, user, message):
         """
         Returns a response message if a match is found, otherwise None
@@ -82,6 +151,8 @@ class Trigger(Element, Restrictable):
             return
 
         def get_response():
+            rng = self.agentml.get_rng()
+
             # Does the user have a limit for this response enforced?
             if user.is_limited(self):
                 if self.ulimit_blocking:
@@ -107,7 +178,7 @@ class Trigger(Element, Restrictable):
             # Chance testing
             if self.chance is not None and self.chance != 100:
                 # Chance succeeded
-                if self.chance >= random.uniform(0, 100):
+                if self.chance >= rng.uniform(0, 100):
                     self._log.info('Trigger had a {chance}% chance of being selected and succeeded selection'
                                    .format(chance=self.chance))
                 # Chance failed
@@ -121,7 +192,11 @@ class Trigger(Element, Restrictable):
                                    .format(chance=self.chance))
                     return ''
 
-            random_response = self._responses.random(user)
+            responses = self.responses
+            if tracer is None:
+                random_response = responses.random(user, rng, stats)
+            else:
+                random_response = tracer.call(SELECT, responses.random, user, rng, stats)
             if not random_response and self.blocking:
                 self._log.info('Trigger was matched, but there are no available responses and the trigger is blocking '
                                'any further attempts. Giving up')
@@ -135,27 +210,72 @@ class Trigger(Element, Restrictable):
 
             return random_response
 
+        # Test the pattern, timing the attempt if a profiler is attached
+        profiler = self.agentml.profiler
+        tracer = self.agentml.tracer
+        stats = None if profiler is None else profiler.stats(self)
+        start = None if stats is None else default_timer()
+
+        if tracer is None:
+            matched = self._match_pattern(message)
+        else:
+            matched = tracer.call(MATCH, self._match_pattern, message)
+
+        if stats is not None:
+            stats.regex_time += default_timer() - start
+            stats.attempts += 1
+            stats.hits += matched
+
+        if matched:
+            return get_response()
+
+    def _match_pattern(self, message):
+        """
+        Test the message against this trigger's pattern, assigning any wildcards that were captured
+        :param message: The message to match
+        :type  message: agentml.Message
+
+        :rtype: bool
+        """
         # String match
-        if isinstance(self.pattern, string_types) and str(message) == self.pattern:
+        if isinstance(self.pattern, string_types):
+            if str(message) != self.pattern:
+                return False
+
             self._log.info('String Pattern matched: {match}'.format(match=self.pattern))
-            return get_response()
+            return True
 
         # Regular expression match
-        if hasattr(self.pattern, 'match'):
-            match = self.pattern.match(str(message))
-            if match:
-                self._log.info('Regex pattern matched: {match}'.format(match=self.pattern.pattern))
-
-                # Parse pattern wildcards
-                self.stars['normalized'] = match.groups()
-                for message_format in [message.CASE_PRESERVED, message.RAW]:
-                    message.format = message_format
-                    format_match = self.pattern.match(str(message))
-                    if format_match:
-                        self.stars[message_format] = format_match.groups()
-
-                self._log.debug('Assigning pattern wildcards: {stars}'.format(stars=str(self.stars)))
-                return get_response()
+        match = self.pattern.match(str(message))
+        if not match:
+            return False
+
+        self._log.info('Regex pattern matched: {match}'.format(match=self.pattern.pattern))
+
+        # Parse pattern wildcards
+        self.stars['normalized'] = match.groups()
+        for message_format in [message.CASE_PRESERVED, message.RAW]:
+            message.format = message_format
+            format_match = self.pattern.match(str(message))
+            if format_match:
+                self.stars[message_format] = format_match.groups()
+        message.format = message.NORMALIZED
+
+        self._log.debug('Assigning pattern wildcards: {stars}'.format(stars=str(self.stars)))
+        return True
+
+    def matches(self, message):
+        """
+        Test whether or not a message matches this trigger's pattern, without checking any other requirements
+        :param message: The normalized message
+        :type  message: str
+
+        :rtype: bool
+        """
+        if isinstance(self.pattern, string_types):
+            return message == self.pattern
+
+        return bool(self.pattern.match(message))
 
     def apply_reactions(self, user):
         """
@@ -163,6 +283,11 @@ class Trigger(Element, Restrictable):
         :param user: The user triggering the response
         :type  user: agentml.User
         """
+        # Let the active request know if this trigger changes any state
+        context = self.agentml.context if self.global_limit or self.user_limit or self.vars else None
+        if context:
+            context.add_effect()
+
         # User attributes
         if self.global_limit:
             self._log.info('Enforcing Global Trigger Limit of {num} seconds'.format(num=self.global_limit))
@@ -180,10 +305,14 @@ class Trigger(Element, Restrictable):
             # Set a user variable
             if var_type == 'user':
                 self.user.set_var(var_name, var_value)
+                if context:
+                    context.reads.invalidate('user_var', var_name)
 
             # Set a global variable
             if var_type == 'global':
                 self.agentml.set_var(var_name, var_value)
+                if context:
+                    context.reads.invalidate('global_var', var_name)
 
         # agentml.mood = self.mood
 
@@ -216,15 +345,12 @@ class Trigger(Element, Restrictable):
 
         :rtype: tuple of (str, bool)
         """
-        replaced = False
-        match = wildcard.search(string)
+        string, replacements = wildcard.subn(regex, string)
 
-        if match:
-            string = wildcard.sub(regex, string)
+        if replacements:
             logging.getLogger('agentml.trigger').debug('Parsing Pattern wildcards: {pattern}'.format(pattern=string))
-            replaced = True
 
-        return string, replaced
+        return string, bool(replacements)
 
     @staticmethod
     def count_words(pattern):
@@ -236,9 +362,7 @@ class Trigger(Element, Restrictable):
         :return: The word count first, then the total length of all words
         :rtype : tuple of (int, int)
         """
-        word_pattern = re.compile(r'(\b(?<![\(\)\[\]\|])\w\w*\b(?![\(\)\[\]\|]))', re.IGNORECASE)
-
-        words = word_pattern.findall(pattern)
+        words = PATTERN_WORD.findall(pattern)
         word_count = len(words)
         word_len = sum(len(word) for word in words)
 
@@ -301,65 +425,44 @@ class Trigger(Element, Restrictable):
         if regex:
             self._log.info('Attempting to compile trigger as a raw regex')
             try:
-                self.pattern = re.compile(element.text)
+                self.pattern = compile_pattern(element.text)
             except sre_constants.error:
                 self._log.warn('Attempted to compile an invalid regular expression in {path} ; {regex}'
                                .format(path=self.file_path, regex=element.text))
                 raise AgentMLSyntaxError
             return
 
-        self.pattern = normalize(element.text, True)
+        self.pattern = self.pattern_text = self.agentml.intern(normalize(element.text, True))
         self._log.debug('Normalizing pattern: ' + self.pattern)
         compile_as_regex = False
 
         # Wildcard patterns and replacements
-        captured_wildcard = re.compile(r'(?<!\\)\(\*\)')
-        wildcard = re.compile(r'(?<!\\)\*')
-
-        capt_wild_numeric = re.compile(r'(?<!\\)\(#\)')
-        wild_numeric = re.compile(r'(?<!\\)#')
-
-        capt_wild_alpha = re.compile(r'(?<!\\)\(_\)')
-        wild_alpha = re.compile(r'(?<!\\)_')
-
-        wildcard_replacements = [
-            (captured_wildcard, r'(.+)'),
-            (wildcard,          r'(?:.+)'),
-            (capt_wild_numeric, r'(\d+)'),
-            (wild_numeric,      r'(?:\d+)'),
-            (capt_wild_alpha,   r'([a-zA-Z]+)'),
-            (wild_alpha,        r'(?:[a-zA-Z]+)'),
-        ]
-
-        for wildcard, replacement in wildcard_replacements:
+        for wildcard, replacement in WILDCARD_REPLACEMENTS:
             self.pattern, match = self.replace_wildcards(self.pattern, wildcard, replacement)
             compile_as_regex = bool(match) or compile_as_regex
 
         # Required and optional choices
-        req_choice = re.compile(r'\(([\w\s\|]+)\)')
-        opt_choice = re.compile(r'\s?\[([\w\s\|]+)\]\s?')
-
-        if req_choice.search(self.pattern):
+        if REQUIRED_CHOICE.search(self.pattern):
             def sub_required(pattern):
                 patterns = pattern.group(1).split('|')
                 return r'(\b{options})\b'.format(options='|'.join(patterns))
 
-            self.pattern = req_choice.sub(sub_required, self.pattern)
+            self.pattern = REQUIRED_CHOICE.sub(sub_required, self.pattern)
             self._log.debug('Parsing Pattern required choices: ' + self.pattern)
             compile_as_regex = True
 
-        if opt_choice.search(self.pattern):
+        if OPTIONAL_CHOICE.search(self.pattern):
             def sub_optional(pattern):
                 patterns = pattern.group(1).split('|')
                 return r'\s?(?:\b(?:{options})\b)?\s?'.format(options='|'.join(patterns))
 
-            self.pattern = opt_choice.sub(sub_optional, self.pattern)
+            self.pattern = OPTIONAL_CHOICE.sub(sub_optional, self.pattern)
             self._log.debug('Parsing Pattern optional choices: ' + self.pattern)
             compile_as_regex = True
 
         if compile_as_regex:
             self._log.debug('Compiling Pattern as regex')
-            self.pattern = re.compile('^{pattern}$'.format(pattern=self.pattern), re.IGNORECASE)
+            self.pattern = compile_pattern('^{pattern}$'.format(pattern=self.pattern), re.IGNORECASE)
         else:
             self._log.debug('Pattern is atomic')
             self.pattern_is_atomic = True
@@ -375,6 +478,9 @@ class Trigger(Element, Restrictable):
             self.pattern = self.pattern.replace('\(#)', '(#)')
             self.pattern = self.pattern.replace('\(_)', '(_)')
 
+            # Identical atomic patterns in other topics and files share the same string
+            self.pattern = self.agentml.intern(self.pattern)
+
     def _parse_response(self, element):
         """
         Parse a trigger response
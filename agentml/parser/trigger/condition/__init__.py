@@ -1,12 +1,16 @@
 import logging
 from six import add_metaclass
-from abc import ABCMeta, abstractmethod
-from agentml.parser import Element
-from agentml.common import attribute
+from abc import abstractmethod
+from agentml.parser import Element, ParserMeta, parse_children
+from agentml.common import attribute, to_number, ReadCache
+from agentml.tracing import CONDITIONS
 from agentml.parser.trigger.response import Response
 
+# Placeholder for values that have not been retrieved yet
+MISSING = object()
 
-@add_metaclass(ABCMeta)
+
+@add_metaclass(ParserMeta)
 class BaseCondition(object):
     """
     AgentML Base Condition class
@@ -29,24 +33,164 @@ class BaseCondition(object):
         self.statements = []
         self.else_statement = None
 
+        # Evaluation plan, compiled on first use: the (type, name) shared by every statement or None if they differ,
+        # and a decision table mapping values to statement indexes when every statement is an "is" comparison
+        self._compiled = False
+        self._shared = None
+        self._table = None
+
         self.type = kwargs['type'] if 'type' in kwargs else attribute(self._element, 'type', 'user_var')
         self._log = logging.getLogger('agentml.parser.trigger.condition')
 
-    def evaluate(self, user):
+    def evaluate(self, user, reads=None):
         """
         Evaluate the conditional statement and return its contents if a successful evaluation takes place
         :param user: The active user object
         :type  user: agentml.User or None
 
+        :param reads: The request's cache of condition values, see get_statement
+        :type  reads: agentml.common.ReadCache or None
+
         :return: True if the condition evaluates successfully, otherwise False
         :rtype : bool
         """
-        for statement in self.statements:
-            evaluated = statement.evaluate(self.agentml, user)
-            if evaluated:
-                return evaluated
+        index = self.get_statement(user, reads)
+        if index is None:
+            return False
+
+        if index == len(self.statements):
+            return self.else_statement
+
+        return self.statements[index].contents
+
+    def get_statement(self, user, reads=None):
+        """
+        Evaluate the conditional statement and return the index of the statement that evaluated successfully
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param reads: The request's cache of condition values, keyed by (condition type, key). Values are only read once
+            per evaluation if not specified
+        :type  reads: agentml.common.ReadCache or None
+
+        :return: The statement index, len(self.statements) for the else statement, or None if nothing evaluated
+        :rtype : int or None
+        """
+        tracer = self.agentml.tracer
+        start = tracer.start(CONDITIONS) if tracer else None
+
+        try:
+            if not self._compiled:
+                self._compile()
+
+            if reads is None:
+                reads = ReadCache()
+
+            if self._shared:
+                index = self._evaluate(user, reads)
+            else:
+                index = self._evaluate_each(user, reads)
+            if index is not None:
+                return index
+
+            return len(self.statements) if self.else_statement else None
+        finally:
+            if tracer:
+                tracer.end(CONDITIONS, start)
+
+    def _compile(self):
+        """
+        Prepare the evaluation plan for the statements of this condition
+        """
+        self._shared = None
+        self._table = None
+
+        keys = set((statement.type, statement.name) for statement in self.statements)
+        if len(keys) == 1:
+            self._shared = keys.pop()
+
+            # The first statement with contents comparing against a value wins, so later duplicates are ignored
+            if all(statement.operator == ConditionStatement.IS for statement in self.statements):
+                self._table = {}
+                for index, statement in enumerate(self.statements):
+                    if statement.contents:
+                        self._table.setdefault(statement.value, index)
+
+        self._compiled = True
+
+    def _evaluate_each(self, user, reads):
+        """
+        Evaluate each statement in turn, looking up every statement's value separately
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param reads: The request's cache of condition values
+        :type  reads: agentml.common.ReadCache
+
+        :return: The index of the first statement that evaluated successfully, or None
+        :rtype : int or None
+        """
+        for index, statement in enumerate(self.statements):
+            if statement.evaluate(self.agentml, user, reads):
+                return index
+
+    def _evaluate(self, user, reads):
+        """
+        Evaluate statements that all test the same value, looking the value up only once
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param reads: The request's cache of condition values
+        :type  reads: agentml.common.ReadCache
+
+        :return: The index of the first statement that evaluated successfully, or None
+        :rtype : int or None
+        """
+        statement = self.statements[0]
+        cond_type = statement.get_type(self.agentml)
+        if cond_type is None:
+            return
+
+        type_name, name = self._shared
+        value = number = MISSING
+
+        if self._table is not None:
+            value = reads.read(cond_type, type_name, self.agentml, user, name)
+            try:
+                return self._table.get(value)
+            except TypeError:
+                # Unhashable values can't be looked up, but they can still be compared
+                pass
+
+        # Retrieve the value and its numeric form as the statements need them
+        for index, statement in enumerate(self.statements):
+            if not statement.contents:
+                continue
+
+            if statement.numeric:
+                if number is MISSING:
+                    number = reads.read_number(cond_type, type_name, self.agentml, user, name)
+                operand = number
+            else:
+                if value is MISSING:
+                    value = reads.read(cond_type, type_name, self.agentml, user, name)
+                operand = value
+
+            if statement.test(operand):
+                return index
+
+    def get_branches(self):
+        """
+        Retrieve the contents of every statement in this condition keyed by the statement index
+        :return: A list of (index, contents) tuples, the else statement (if defined) using len(self.statements)
+        :rtype : list of (int, tuple)
+        """
+        branches = [(index, statement.contents) for index, statement in enumerate(self.statements)]
 
-        return self.else_statement or False
+        if self.else_statement:
+            branches.append((len(self.statements), tuple(self.else_statement)))
+
+        return branches
 
     @abstractmethod
     def get_contents(self, element):
@@ -66,12 +210,7 @@ class BaseCondition(object):
         """
         self.type = attribute(self._element, 'type') or self.type
 
-        for child in self._element:
-            method_name = '_parse_{0}'.format(str(child.tag))  # TODO: This is a hack, skip comment objects here
-
-            if hasattr(self, method_name):
-                parse = getattr(self, method_name)
-                parse(child)
+        parse_children(self, self._element)
 
     def _parse_if(self, element):
         """
@@ -95,6 +234,7 @@ class BaseCondition(object):
         # Get the contents of the element in tuple form and append our if statement
         contents = tuple(self.get_contents(element))
         self.statements.append(ConditionStatement(cond_type, operator, contents, value, name))
+        self._compiled = False
 
     def _parse_elif(self, element):
         """
@@ -160,6 +300,7 @@ class ConditionStatement:
     LESS_THAN_OR_EQUAL = 'lte'
 
     operators = [IS, IS_NOT, GREATER_THAN, GREATER_THAN_OR_EQUAL, LESS_THAN, LESS_THAN_OR_EQUAL]
+    numeric_operators = [GREATER_THAN, GREATER_THAN_OR_EQUAL, LESS_THAN, LESS_THAN_OR_EQUAL]
 
     def __init__(self, cond_type, operator, contents, value=None, name=None):
         """
@@ -186,7 +327,73 @@ class ConditionStatement:
         self.name = name
         self._log = logging.getLogger('agentml.parser.trigger.condition.statement')
 
-    def evaluate(self, agentml, user=None):
+        # The comparison against the value, with the value already parsed, and the condition type it was bound to.
+        # Numeric statements are tested against the numeric form of the key value
+        self.numeric = operator in self.numeric_operators
+        self.test = self._compile(operator, value)
+        self._cond_type = None
+        self._generation = None
+
+        self._debug_message = 'Evaluating conditional statement: {statement}'\
+            .format(statement=' '.join(filter(None, [self.type, self.name, self.operator, self.value])))
+
+    @classmethod
+    def _compile(cls, operator, value):
+        """
+        Build the function used to compare a key value against the statement value
+        :param operator: The operator of the condition statement
+        :type  operator: str or None
+
+        :param value: The value of the condition statement
+        :type  value: str, int, float or None
+
+        :return: A function returning True if the key value satisfies the statement
+        :rtype : callable
+        """
+        # Atomic comparisons
+        if operator is None:
+            return bool
+
+        if operator == cls.IS:
+            return lambda key_value: key_value == value
+
+        if operator == cls.IS_NOT:
+            return lambda key_value: key_value != value
+
+        # All remaining operators are numeric based, so both values must contain a valid integer or float
+        value = to_number(value)
+        compare = {
+            cls.GREATER_THAN: float.__gt__,
+            cls.GREATER_THAN_OR_EQUAL: float.__ge__,
+            cls.LESS_THAN: float.__lt__,
+            cls.LESS_THAN_OR_EQUAL: float.__le__
+        }.get(operator)
+
+        if value is None or compare is None:
+            return lambda number: False
+
+        return lambda number: number is not None and compare(number, value)
+
+    def get_type(self, agentml):
+        """
+        Retrieve the condition type this statement evaluates, re-binding it if condition types have changed
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :return: The condition type, or None if it is not defined
+        :rtype : agentml.parser.trigger.condition.types.ConditionType or None
+        """
+        if self._generation != agentml.condition_generation:
+            self._cond_type = agentml.conditions.get(self.type)
+            self._generation = agentml.condition_generation
+
+            if self._cond_type is None:
+                self._log.error('Unknown condition type, "{type}", unable to evaluate condition statement'
+                                .format(type=self.type))
+
+        return self._cond_type
+
+    def evaluate(self, agentml, user=None, reads=None):
         """
         Evaluate the conditional statement and return its contents if a successful evaluation takes place
         :param user: The active user object
@@ -195,48 +402,28 @@ class ConditionStatement:
         :param agentml: The active AgentML instance
         :type  agentml: AgentML
 
+        :param reads: The request's cache of condition values, keyed by (condition type, key)
+        :type  reads: agentml.common.ReadCache or None
+
         :return: Condition contents if the condition evaluates successfully, otherwise False
         :rtype : tuple or bool
         """
-        self._log.debug('Evaluating conditional statement: {statement}'
-                        .format(statement=' '.join(filter(None, [self.type, self.name, self.operator, self.value]))))
+        self._log.debug(self._debug_message)
 
         # Get the value of our key type
-        if self.type not in agentml.conditions:
-            self._log.error('Unknown condition type, "{type}", unable to evaluate condition statement'
-                            .format(type=self.type))
+        cond_type = self.get_type(agentml)
+        if cond_type is None:
             return
 
-        key_value = agentml.conditions[self.type].get(agentml, user, self.name)
-
-        # Atomic comparisons
-        if self.operator is None and key_value:
-            return self.contents
-
-        if (self.operator == self.IS) and (key_value == self.value):
-            return self.contents
+        if reads is None:
+            reads = ReadCache()
 
-        if (self.operator == self.IS_NOT) and (key_value != self.value):
-            return self.contents
-
-        # All remaining self.operators are numeric based, so key_value must contain a valid integer or float
-        try:
-            key_value = float(key_value)
-            value = float(self.value)
-        except (ValueError, TypeError):
-            return False
-
-        # Numeric comparisons
-        if (self.operator == self.GREATER_THAN) and (key_value > value):
-            return self.contents
-
-        if (self.operator == self.GREATER_THAN_OR_EQUAL) and (key_value >= value):
-            return self.contents
-
-        if (self.operator == self.LESS_THAN) and (key_value < value):
-            return self.contents
+        if self.numeric:
+            operand = reads.read_number(cond_type, self.type, agentml, user, self.name)
+        else:
+            operand = reads.read(cond_type, self.type, agentml, user, self.name)
 
-        if (self.operator == self.LESS_THAN_OR_EQUAL) and (key_value <= value):
+        if self.test(operand):
             return self.contents
 
         return False
@@ -6,6 +6,8 @@ class GlobalVarType(ConditionType):
     """
     Global Variable condition type
     """
+    typed = True
+
     def __init__(self):
         """
         Initialize a new Global Var Type instance
@@ -34,3 +36,26 @@ class GlobalVarType(ConditionType):
             return agentml.get_var(key)
         except VarNotDefinedError:
             return
+
+    def get_number(self, agentml, user=None, key=None):
+        """
+        Return the stored numeric value of a global variable
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param key: The variables key
+        :type  key: str
+
+        :return: Current value of the global variable as a float (or None if it isn't numeric or hasn't been set)
+        :rtype : float or None
+        """
+        if not key:
+            return
+
+        try:
+            return agentml.get_number(key)
+        except VarNotDefinedError:
+            return
@@ -1,9 +1,19 @@
 from abc import ABCMeta, abstractmethod
 from six import add_metaclass
+from agentml.common import to_number
 
 
 @add_metaclass(ABCMeta)
 class ConditionType(object):
+    # Whether get_number reads a stored numeric value, rather than parsing the value returned by get
+    typed = False
+
+    # Optional bulk retrieval hook, prefetch(agentml, user, keys). Response containers call it once per request with
+    # every key their conditions of this type may evaluate, so types backed by an external store can replace a round
+    # trip per key with a single query. It should return the retrieved values keyed by key. Keys without a prefetched
+    # value are retrieved with get() as usual
+    prefetch = None
+
     def __init__(self, name):
         """
         Initialize a new Condition Type instance
@@ -28,3 +38,20 @@ class ConditionType(object):
         :return: Current value of the condition type
         """
         pass
+
+    def get_number(self, agentml, user=None, key=None):
+        """
+        Evaluate and return the current value of the condition type as a number
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param key: The types key (if relevant)
+        :type  key: str
+
+        :return: Current value of the condition type as a float, or None if it isn't numeric
+        :rtype : float or None
+        """
+        return to_number(self.get(agentml, user, key))
@@ -6,6 +6,8 @@ class UserVarType(ConditionType):
     """
     User Variable condition type
     """
+    typed = True
+
     def __init__(self):
         """
         Initialize a new User Var Type instance
@@ -34,3 +36,26 @@ class UserVarType(ConditionType):
             return user.get_var(key)
         except VarNotDefinedError:
             return
+
+    def get_number(self, agentml, user=None, key=None):
+        """
+        Return the stored numeric value of a user variable
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param key: The variables key
+        :type  key: str
+
+        :return: Current value of the user variable as a float (or None if it isn't numeric or hasn't been set)
+        :rtype : float or None
+        """
+        if not user or not key:
+            return
+
+        try:
+            return user.get_number(key)
+        except VarNotDefinedError:
+            return
@@ -1,8 +1,10 @@
 import logging
 from time import time
+from timeit import default_timer
 from collections import Iterable
 from agentml.common import attribute, int_attribute, newlines_to_spaces
-from agentml.parser import Element, Restrictable
+from agentml.parser import Element, Restrictable, parse_children
+from agentml.tracing import RENDER
 from .container import ResponseContainer
 
 
@@ -63,7 +65,13 @@ class Response(Element, Restrictable):
         :rtype : str
         """
         self._log.debug('Converting Response object to string format')
-        response = ''.join(map(str, self._response)).strip()
+        profiler = self.agentml.profiler
+        if profiler is None:
+            response = self._render()
+        else:
+            start = default_timer()
+            response = self._render()
+            profiler.stats(self.trigger).render_time += default_timer() - start
 
         self._log.debug('Resetting parent Trigger temporary containers')
         self.stars = {
@@ -71,29 +79,52 @@ class Response(Element, Restrictable):
             'case_preserved': (),
             'raw': ()
         }
-        user = self.trigger.user
         self.trigger.user = None
 
         if self.redirect:
             self._log.info('Redirecting response to: {msg}'.format(msg=response))
-            groups = self.agentml.request_log.most_recent().groups
-            response = self.agentml.get_reply(user.id, response, groups)
+            response = self.agentml.resolve_redirect(response)
             if not response:
                 self._log.info('Failed to retrieve a valid response when redirecting')
                 return ''
 
         return response
 
+    def _render(self):
+        """
+        Render the response template and its tags
+        :rtype: str
+        """
+        tracer = self.agentml.tracer
+        if tracer is None:
+            return ''.join(map(str, self._response)).strip()
+
+        start = tracer.start(RENDER)
+        try:
+            return ''.join(map(str, self._response)).strip()
+        finally:
+            tracer.end(RENDER, start)
+
     def apply_reactions(self, user):
         """
         Set active topics and limits after a response has been triggered
         :param user: The user triggering the response
         :type  user: agentml.User
         """
+        # Let the active request know if this response changes any state
+        changes_state = self.topic is not False or self.global_limit or self.user_limit or self.vars
+        context = self.agentml.context if changes_state else None
+        if context:
+            context.add_effect()
+
         # User attributes
         if self.topic is not False:
             self._log.info('Setting User Topic to: {topic}'.format(topic=self.topic))
+            if not self.agentml.has_topic(self.topic):
+                self._log.warn('Setting User Topic to "{topic}", which has no triggers'.format(topic=self.topic))
             user.topic = self.topic
+            if context:
+                context.reads.invalidate('topic')
 
         if self.global_limit:
             self._log.info('Enforcing Global Response Limit of {num} seconds'.format(num=self.global_limit))
@@ -111,10 +142,14 @@ class Response(Element, Restrictable):
             # Set a user variable
             if var_type == 'user':
                 self.trigger.user.set_var(var_name, var_value)
+                if context:
+                    context.reads.invalidate('user_var', var_name)
 
             # Set a global variable
             if var_type == 'global':
                 self.trigger.agentml.set_var(var_name, var_value)
+                if context:
+                    context.reads.invalidate('global_var', var_name)
 
     def _parse(self):
         """
@@ -128,12 +163,7 @@ class Response(Element, Restrictable):
         if self._element.tag == 'redirect':
             return self._parse_redirect(self._element)
 
-        for child in self._element:
-            method_name = '_parse_' + child.tag
-
-            if hasattr(self, method_name):
-                parse = getattr(self, method_name)
-                parse(child)
+        parse_children(self, self._element)
 
     def _parse_template(self, element):
         """
@@ -143,7 +173,7 @@ class Response(Element, Restrictable):
         """
         # If the response element has no tags, just store the raw text as the only response
         if not len(element):
-            self._response = (newlines_to_spaces(element.text),)
+            self._response = self.agentml.intern((self.agentml.intern(newlines_to_spaces(element.text)),))
             self._log.info('Assigning text only response')
             return
 
@@ -158,7 +188,11 @@ class Response(Element, Restrictable):
         """
         self._log.info('Parsing response as a redirect')
         self.redirect = True
-        return self._parse_template(element)
+        self._parse_template(element)
+
+        # Literal redirects always request the same message, so their targets can be resolved ahead of time
+        if not len(element) and element.text:
+            self.agentml.add_redirect_target(''.join(self._response).strip())
 
     def _parse_priority(self, element):
         """
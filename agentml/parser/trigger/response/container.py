@@ -1,7 +1,8 @@
 import logging
 import random
+from timeit import default_timer
 from collections import OrderedDict
-from agentml.common import weighted_choice
+from agentml.common import WeightedSampler, ReadCache
 from agentml.errors import LimitError, ChanceError
 
 
@@ -16,6 +17,8 @@ class ResponseContainer(object):
         # Responses are contained in an ordered dictionary, with the keys being the priority level
         self._responses = OrderedDict()
         self._conditionals = {}  # keys contain response id()'s, values contain Condition objects
+        self._branches = {}  # keys contain Response objects, values contain (Condition, statement index) tuples
+        self._prefetch = {}  # keys contain condition type names, values contain the keys their statements evaluate
         self.sorted = False  # Priority levels need to be sorted after parsing before they can be iterated
         self._log = logging.getLogger('agentml.parser.trigger.response.container')
 
@@ -25,6 +28,20 @@ class ResponseContainer(object):
         """
         self._log.debug('Sorting responses by priority')
         self._responses = OrderedDict(sorted(list(self._responses.items()), reverse=True))
+
+        # Build the condition branch table, mapping each conditional response to the statement it belongs to
+        self._log.debug('Building condition branch table')
+        self._branches = {}
+        self._prefetch = {}
+        for condition in set(self._conditionals.values()):
+            for index, contents in condition.get_branches():
+                for response in contents:
+                    if response in self._conditionals:
+                        self._branches[response] = (condition, index)
+
+            for statement in condition.statements:
+                self._prefetch.setdefault(statement.type, set()).add(statement.name)
+
         self.sorted = True
 
     def add(self, response, condition=None):
@@ -45,16 +62,65 @@ class ResponseContainer(object):
         # If this response requires a condition be met, assign it to the Response object directly
         if condition:
             self._log.debug('Response has a condition defined')
+            self.sorted = False  # The condition branch table needs to be rebuilt
             self._conditionals[response] = condition
 
         self._responses[response.priority].append(response)
 
-    def random(self, user=None):
+    def __iter__(self):
+        """
+        Iterate over every Response in the container, including conditional responses
+        :rtype: collections.Iterator of parser.trigger.response.Response
+        """
+        for responses in self._responses.values():
+            for response in responses:
+                yield response
+
+    def prefetch(self, agentml, user=None):
+        """
+        Retrieve the values every condition in this container may evaluate from condition types that support bulk
+        retrieval (see ConditionType.prefetch). Values are kept in the request's read cache for the rest of the request,
+        or until a reaction changes state
+        :param agentml: The active AgentML instance
+        :type  agentml: AgentML
+
+        :param user: The active user object
+        :type  user: agentml.User or None
+
+        :return: The read cache the values were stored in, keys contain (condition type, key) tuples
+        :rtype : agentml.common.ReadCache
+        """
+        context = agentml.context
+        reads = context.reads if context else ReadCache()
+
+        for type_name, keys in self._prefetch.items():
+            prefetch = getattr(agentml.conditions.get(type_name), 'prefetch', None)
+            if prefetch is None:
+                continue
+
+            keys = [key for key in keys if (type_name, key) not in reads]
+            if not keys:
+                continue
+
+            values = prefetch(agentml, user, keys)
+            self._log.debug('Prefetched {count} {type} condition values'.format(count=len(values), type=type_name))
+            for key, value in values.items():
+                reads[(type_name, key)] = value
+
+        return reads
+
+    def random(self, user=None, rng=random, stats=None):
         """
         Retrieve a random Response
         :param user: The user to test for active limitations and to apply response actions on
         :type  user: agentml.User or None
 
+        :param rng: The random number generator to use, defaults to the global random module
+        :type  rng: random.Random
+
+        :param stats: Profiler counters to record condition evaluation time in, if profiling is enabled
+        :type  stats: agentml.profiler.TriggerStats or None
+
         :return: A randomly selected Response object
         :rtype : parser.trigger.response.Response
         """
@@ -62,8 +128,8 @@ class ResponseContainer(object):
             self._sort()
 
         self._log.info('Attempting to retrieve a random response')
-        failed_conditions = []
-        passed_conditions = {}
+        evaluated_conditions = {}  # keys contain Condition objects, values contain the passing statement index
+        reads = None  # the request's cache of condition values, keys contain (condition type, key) tuples
         successful_response = None
 
         for priority, responses in self._responses.items():
@@ -71,45 +137,27 @@ class ResponseContainer(object):
             response_pool = []
 
             for response in responses:
-                # If the response has a condition, attempt to evaluate it
-                condition = self._conditionals[response] if response in self._conditionals else None
-                if condition:
-                    # Condition has already been evaluated and the evaluation failed, skip and continue
-                    if condition in failed_conditions:
-                        self._log.debug('Skipping response due to a previously failed condition check')
-                        continue
-                    # Condition has already been evaluated successfully, check if this response is in the cond. results
-                    elif condition in passed_conditions:
-                        if response in passed_conditions[condition]:
-                            self._log.debug('Response is in a condition that has already been successfully evaluated')
-                        else:
-                            # This error is kinda ambiguous, but it basically means the condition evaluated true,
-                            # but this specific response was in a different if / elif / else statement
-                            self._log.debug('Response is in a condition that has already been successfully evaluated, '
-                                            'but the response was in the wrong condition statement, skipping')
-                            continue
-                    # Condition has not been evaluated yet, process it now and save the result
-                    elif condition not in passed_conditions:
+                # If the response has a condition, make sure it is in the statement that evaluated successfully
+                branch = self._branches.get(response)
+                if branch:
+                    condition, index = branch
+
+                    # Each condition only needs to be evaluated once, so save the result for the remaining responses
+                    if condition not in evaluated_conditions:
                         self._log.debug('Evaluating a new condition')
-                        evaluated = condition.evaluate(user)
-                        # Fail, skip and continue
-                        if not evaluated:
-                            self._log.debug('Condition failed to evaluate successfully, skipping response')
-                            failed_conditions.append(condition)
-                            continue
-
-                        # Pass
-                        self._log.debug('Condition evaluated successfully, checking if we\'re in the right condition '
-                                        'statement')
-                        passed_conditions[condition] = evaluated
-
-                        if response in passed_conditions[condition]:
-                            self._log.debug('Response is in the successfully evaluated condition statement, continuing')
+                        if reads is None:
+                            reads = self.prefetch(condition.agentml, user)
+
+                        if stats is None:
+                            evaluated_conditions[condition] = condition.get_statement(user, reads)
                         else:
-                            # This error is kinda ambiguous, but it basically means the condition evaluated true,
-                            # but this specific response was in a different if / elif / else statement
-                            self._log.debug('Response was in the wrong condition statement, skipping')
-                            continue
+                            start = default_timer()
+                            evaluated_conditions[condition] = condition.get_statement(user, reads)
+                            stats.condition_time += default_timer() - start
+
+                    if evaluated_conditions[condition] != index:
+                        self._log.debug('Response is not in the successfully evaluated condition statement, skipping')
+                        continue
 
                 # Does the user have a limit for this response enforced?
                 if user and user.is_limited(response):
@@ -144,9 +192,10 @@ class ResponseContainer(object):
                 continue
 
             # Start a loop so we can weed out responses that fail chance conditions
+            response_sampler = WeightedSampler(response_pool)
             while True:
-                # Retrieve a random weighted response
-                response = weighted_choice(response_pool)
+                # Retrieve (and remove) a random weighted response
+                response = response_sampler.pop(rng)
 
                 # Are we out of responses to try?
                 if not response:
@@ -158,7 +207,7 @@ class ResponseContainer(object):
                     break
 
                 # Chance succeeded
-                if response.chance >= random.uniform(0, 100):
+                if response.chance >= rng.uniform(0, 100):
                     self._log.info('Response had a {chance}% chance of being selected and succeeded selection'
                                    .format(chance=response.chance))
                     successful_response = response
@@ -172,7 +221,6 @@ class ResponseContainer(object):
 
                     self._log.info('Response had a {chance}% chance of being selected but failed selection'
                                    .format(chance=response.chance))
-                    response_pool = [r for r in response_pool if r[0] is not response]
                     continue
 
             # If we have no successful response defined, that means a chance condition for all the responses failed and
@@ -0,0 +1,176 @@
+"""
+Per-trigger hit counters and match cost profiling
+
+Profiling is disabled by default and costs a single attribute check per trigger attempt. To enable it, assign a
+Profiler instance to an AgentML instance:
+
+    aml.profiler = Profiler()
+    ...
+    aml.profiler.dump()
+
+Or replay a file of messages (one per line) against a brain from the command line:
+
+    python -m agentml.profiler path/to/brain messages.txt --limit 20
+"""
+from __future__ import print_function, division
+import argparse
+import json
+import logging
+import sys
+
+
+class TriggerStats(object):
+    """
+    Profiling counters for a single Trigger
+    """
+    __slots__ = ('trigger', 'attempts', 'hits', 'regex_time', 'condition_time', 'render_time')
+
+    def __init__(self, trigger):
+        """
+        Initialize a new Trigger Stats instance
+        :param trigger: The Trigger being profiled
+        :type  trigger: agentml.parser.trigger.Trigger
+        """
+        self.trigger = trigger
+        self.attempts = 0          # Number of times the pattern was tested against a message
+        self.hits = 0              # Number of times the pattern matched
+        self.regex_time = 0.0      # Seconds spent testing the pattern and extracting wildcards
+        self.condition_time = 0.0  # Seconds spent evaluating response conditions
+        self.render_time = 0.0     # Seconds spent rendering response templates
+
+    @property
+    def pattern(self):
+        """
+        The source of the profiled trigger's pattern
+        :rtype: str
+        """
+        return getattr(self.trigger.pattern, 'pattern', self.trigger.pattern)
+
+    @property
+    def cost(self):
+        """
+        The total time in seconds attributed to this trigger
+        :rtype: float
+        """
+        return self.regex_time + self.condition_time + self.render_time
+
+    def as_dict(self):
+        """
+        Return the counters as a plain dictionary, suitable for serialization
+        :rtype: dict
+        """
+        return {
+            'pattern': self.pattern, 'topic': self.trigger.topic, 'file_path': self.trigger.file_path,
+            'attempts': self.attempts, 'hits': self.hits, 'regex_time': self.regex_time,
+            'condition_time': self.condition_time, 'render_time': self.render_time, 'cost': self.cost
+        }
+
+
+class Profiler(object):
+    """
+    Collects per-trigger match statistics
+    """
+    SORT_KEYS = ('cost', 'attempts', 'hits', 'regex_time', 'condition_time', 'render_time')
+
+    def __init__(self):
+        """
+        Initialize a new Profiler instance
+        """
+        self._stats = {}
+        self._log = logging.getLogger('agentml.profiler')
+
+    def stats(self, trigger):
+        """
+        Retrieve the counters for a trigger, creating them if this is the first time we are seeing it
+        :param trigger: The Trigger instance
+        :type  trigger: agentml.parser.trigger.Trigger
+
+        :rtype: TriggerStats
+        """
+        try:
+            return self._stats[trigger]
+        except KeyError:
+            stats = self._stats[trigger] = TriggerStats(trigger)
+            return stats
+
+    def report(self, sort='cost', limit=None):
+        """
+        Retrieve the collected statistics, most expensive first
+        :param sort: The counter to sort by, one of Profiler.SORT_KEYS
+        :type  sort: str
+
+        :param limit: The maximum number of triggers to return
+        :type  limit: int or None
+
+        :rtype: list of TriggerStats
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError('Unknown sort key: {key}'.format(key=sort))
+
+        report = sorted(self._stats.values(), key=lambda stats: getattr(stats, sort), reverse=True)
+        return report[:limit] if limit is not None else report
+
+    def reset(self):
+        """
+        Discard all collected statistics
+        """
+        self._log.info('Resetting profiler statistics')
+        self._stats = {}
+
+    def dump(self, stream=None, sort='cost', limit=20):
+        """
+        Write a human readable report of the collected statistics
+        :param stream: The stream to write to, defaults to stdout
+        :type  stream: file or None
+
+        :param sort: The counter to sort by, one of Profiler.SORT_KEYS
+        :type  sort: str
+
+        :param limit: The maximum number of triggers to include
+        :type  limit: int or None
+        """
+        stream = stream or sys.stdout
+        print('{:>9} {:>9} {:>10} {:>10} {:>10} {:>10}  {}'
+              .format('attempts', 'hits', 'cost ms', 'regex ms', 'cond ms', 'render ms', 'pattern'), file=stream)
+
+        for stats in self.report(sort, limit):
+            print('{:>9} {:>9} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}  {}'
+                  .format(stats.attempts, stats.hits, stats.cost * 1000, stats.regex_time * 1000,
+                          stats.condition_time * 1000, stats.render_time * 1000, stats.pattern), file=stream)
+
+
+def main(argv=None):
+    from agentml import AgentML
+
+    parser = argparse.ArgumentParser(description='Profile the triggers of an AgentML brain against a list of messages')
+    parser.add_argument('brain', help='directory of AgentML files to load')
+    parser.add_argument('messages', nargs='?', help='file containing one message per line, defaults to stdin')
+    parser.add_argument('--user', default='profiler', help='the user to send the messages as')
+    parser.add_argument('--sort', default='cost', choices=Profiler.SORT_KEYS, help='the counter to sort by')
+    parser.add_argument('--limit', type=int, default=20, help='the number of triggers to report')
+    parser.add_argument('--json', action='store_true', help='output the report as JSON')
+    args = parser.parse_args(argv)
+
+    aml = AgentML(log_level=logging.ERROR)
+    aml.load_directory(args.brain)
+    aml.profiler = Profiler()
+
+    messages = open(args.messages) if args.messages else sys.stdin
+    try:
+        for message in messages:
+            message = message.strip()
+            if message:
+                aml.get_reply(args.user, message)
+    finally:
+        if messages is not sys.stdin:
+            messages.close()
+
+    if args.json:
+        report = [stats.as_dict() for stats in aml.profiler.report(args.sort, args.limit)]
+        print(json.dumps(report, indent=2))
+    else:
+        aml.profiler.dump(sort=args.sort, limit=args.limit)
+
+
+if __name__ == '__main__':
+    main()
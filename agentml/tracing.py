@@ -0,0 +1,256 @@
+"""
+Request tracing hooks
+
+Every get_reply request is broken up into stages. Hooks registered with AgentML.add_trace_hook are notified when each
+stage starts and ends, along with the time the stage took:
+
+    collector = HistogramCollector()
+    aml.add_trace_hook(collector)
+    ...
+    collector.summary()
+
+Stages nest and their timings are inclusive; selecting a response includes evaluating its conditions, rendering a
+response includes any redirects made from inside its template, and a redirect includes matching the redirected message.
+When no hooks are registered, tracing costs a single attribute check per stage.
+"""
+from __future__ import division
+import threading
+from bisect import bisect_left
+from timeit import default_timer
+
+# The entire get_reply request
+REQUEST = 'request'
+# Normalizing the message and applying substitutions
+NORMALIZE = 'normalize'
+# Filtering the triggers that may be attempted by topic and group
+CANDIDATES = 'candidates'
+# Testing a trigger's pattern against the message
+MATCH = 'match'
+# Selecting a response from a matched trigger
+SELECT = 'select'
+# Evaluating a condition block
+CONDITIONS = 'conditions'
+# Rendering a response template and its tags
+RENDER = 'render'
+# Resolving a redirect
+REDIRECT = 'redirect'
+
+STAGES = (REQUEST, NORMALIZE, CANDIDATES, MATCH, SELECT, CONDITIONS, RENDER, REDIRECT)
+
+
+class TraceHook(object):
+    """
+    Base class for tracing hooks, subclasses only need to implement the callbacks they are interested in
+    """
+    def start(self, stage):
+        """
+        Called when a stage starts
+        :param stage: The stage, one of agentml.tracing.STAGES
+        :type  stage: str
+        """
+        pass
+
+    def end(self, stage, elapsed):
+        """
+        Called when a stage ends, including when it ends by raising an exception
+        :param stage: The stage, one of agentml.tracing.STAGES
+        :type  stage: str
+
+        :param elapsed: The time taken by the stage in seconds
+        :type  elapsed: float
+        """
+        pass
+
+
+class Tracer(object):
+    """
+    Dispatches stage events to the registered hooks
+    """
+    def __init__(self, hooks=None):
+        """
+        Initialize a new Tracer instance
+        :param hooks: The hooks to notify
+        :type  hooks: list of TraceHook or None
+        """
+        self.hooks = list(hooks or [])
+
+    def start(self, stage):
+        """
+        Notify hooks that a stage has started
+        :param stage: The stage
+        :type  stage: str
+
+        :return: The start time, to be passed back to end()
+        :rtype : float
+        """
+        for hook in self.hooks:
+            hook.start(stage)
+
+        return default_timer()
+
+    def end(self, stage, start):
+        """
+        Notify hooks that a stage has ended
+        :param stage: The stage
+        :type  stage: str
+
+        :param start: The start time returned by start()
+        :type  start: float
+        """
+        elapsed = default_timer() - start
+        for hook in self.hooks:
+            hook.end(stage, elapsed)
+
+    def call(self, stage, func, *args):
+        """
+        Call a function as a traced stage
+        :param stage: The stage
+        :type  stage: str
+
+        :param func: The function to call
+        :type  func: callable
+
+        :return: The function's return value
+        """
+        start = self.start(stage)
+        try:
+            return func(*args)
+        finally:
+            self.end(stage, start)
+
+
+class Histogram(object):
+    """
+    Histogram of timings with logarithmic (power of two) microsecond buckets
+    """
+    BOUNDS = tuple(2 ** i / 1000000 for i in range(25))  # 1us to ~16.8s
+
+    def __init__(self):
+        """
+        Initialize a new Histogram instance
+        """
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """
+        Record a timing
+        :param value: The timing in seconds
+        :type  value: float
+        """
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile, using the upper bound of the bucket it falls in
+        :param percent: The percentile, from 0 to 100
+        :type  percent: float
+
+        :return: The estimated timing in seconds, or None if nothing has been recorded
+        :rtype : float or None
+        """
+        if not self.count:
+            return None
+
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+
+        return self.max
+
+    def as_dict(self):
+        """
+        Summarize the histogram in milliseconds
+        :rtype: dict
+        """
+        if not self.count:
+            return {'count': 0}
+
+        return {
+            'count': self.count, 'mean': self.total / self.count * 1000, 'p50': self.percentile(50) * 1000,
+            'p90': self.percentile(90) * 1000, 'p99': self.percentile(99) * 1000, 'max': self.max * 1000
+        }
+
+
+class HistogramCollector(TraceHook):
+    """
+    Aggregates the time spent in each stage of a request into histograms
+
+    A stage may run many times in a single request (a pattern is tested for every candidate trigger, for example), so
+    stage timings are summed per request and each request adds a single value to each stage's histogram.
+    """
+    def __init__(self):
+        """
+        Initialize a new Histogram Collector instance
+        """
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _requests(self):
+        """
+        The stage totals of the requests in progress on this thread
+        :rtype: list of dict
+        """
+        try:
+            return self._local.requests
+        except AttributeError:
+            self._local.requests = []
+            return self._local.requests
+
+    def start(self, stage):
+        if stage == REQUEST:
+            self._requests.append({})
+
+    def end(self, stage, elapsed):
+        requests = self._requests
+
+        # Stages traced outside of a request are recorded as they are
+        if not requests:
+            self._record({stage: elapsed})
+            return
+
+        if stage == REQUEST:
+            totals = requests.pop()
+            totals[REQUEST] = elapsed
+            self._record(totals)
+            return
+
+        totals = requests[-1]
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+
+    def _record(self, totals):
+        """
+        Add stage totals to their histograms
+        :param totals: Timings in seconds keyed by stage
+        :type  totals: dict
+        """
+        with self._lock:
+            for stage, elapsed in totals.items():
+                if stage not in self.histograms:
+                    self.histograms[stage] = Histogram()
+                self.histograms[stage].add(elapsed)
+
+    def summary(self):
+        """
+        Summarize each stage's histogram in milliseconds
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((stage, histogram.as_dict()) for stage, histogram in self.histograms.items())
+
+    def reset(self):
+        """
+        Discard all recorded timings
+        """
+        with self._lock:
+            self.histograms = {}
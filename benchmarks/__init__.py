@@ -0,0 +1,7 @@
+"""
+AgentML benchmark suite
+
+Synthetic brains are produced by benchmarks.generator and measured by benchmarks.run, e.g.:
+
+    python -m benchmarks.run --triggers 5000 --output results.json
+"""
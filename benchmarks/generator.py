@@ -0,0 +1,328 @@
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+
+class BrainGenerator(object):
+    """
+    Generates synthetic AgentML brains of a configurable size and mix, along with messages that exercise them
+    """
+    SYLLABLES = ['ba', 'ko', 'ri', 'mu', 'te', 'sa', 'lo', 'ni', 'pe', 'du', 'ga', 'fi', 'zo', 've', 'hu', 'ya']
+    WILDCARDS = ['*', '(*)', '#', '(#)', '_', '(_)', '[{word}]', '({word}|{alt})']
+
+    def __init__(self, triggers=1000, wildcard_ratio=0.5, topics=10, topic_ratio=0.2, groups=5, group_ratio=0.1,
+                 condition_ratio=0.1, random_ratio=0.1, substitutions=50, files=10, vocabulary=2000, duplicate_ratio=0,
+                 seed=0):
+        """
+        Initialize a new Brain Generator instance
+        :param triggers: The total number of triggers to generate
+        :type  triggers: int
+
+        :param wildcard_ratio: The fraction of triggers containing wildcards, choices or optionals
+        :type  wildcard_ratio: float
+
+        :param topics: The number of distinct topics
+        :type  topics: int
+
+        :param topic_ratio: The fraction of triggers placed inside of a topic
+        :type  topic_ratio: float
+
+        :param groups: The number of distinct trigger groups
+        :type  groups: int
+
+        :param group_ratio: The fraction of triggers placed inside of a group
+        :type  group_ratio: float
+
+        :param condition_ratio: The fraction of triggers whose responses are wrapped in a condition block
+        :type  condition_ratio: float
+
+        :param random_ratio: The fraction of triggers whose templates contain a random tag
+        :type  random_ratio: float
+
+        :param substitutions: The number of word substitutions to define
+        :type  substitutions: int
+
+        :param files: The number of AgentML files to spread the triggers across
+        :type  files: int
+
+        :param vocabulary: The number of distinct words patterns are built from
+        :type  vocabulary: int
+
+        :param duplicate_ratio: The fraction of triggers repeating the pattern and responses of an earlier trigger in
+                                another topic, as real brains often do
+        :type  duplicate_ratio: float
+
+        :param seed: Seed for the generator, the same settings and seed always produce the same brain
+        :type  seed: int
+        """
+        self.triggers = triggers
+        self.wildcard_ratio = wildcard_ratio
+        self.topics = topics
+        self.topic_ratio = topic_ratio if topics else 0
+        self.groups = groups
+        self.group_ratio = group_ratio if groups else 0
+        self.condition_ratio = condition_ratio
+        self.random_ratio = random_ratio
+        self.substitutions = substitutions
+        self.files = max(files, 1)
+        self.vocabulary = vocabulary
+        self.duplicate_ratio = duplicate_ratio
+        self.seed = seed
+
+        self._rng = random.Random(seed)
+        self._words = self._make_words(vocabulary)
+        self._subs = self._make_substitutions(substitutions)
+        self._sub_words = dict((replacement, word) for word, replacement in self._subs)
+        self._triggers = self._make_triggers()
+
+    @property
+    def config(self):
+        """
+        The settings this brain was generated with
+        :rtype: dict
+        """
+        return {
+            'triggers': self.triggers, 'wildcard_ratio': self.wildcard_ratio, 'topics': self.topics,
+            'topic_ratio': self.topic_ratio, 'groups': self.groups, 'group_ratio': self.group_ratio,
+            'condition_ratio': self.condition_ratio, 'random_ratio': self.random_ratio,
+            'substitutions': self.substitutions, 'files': self.files, 'vocabulary': self.vocabulary,
+            'duplicate_ratio': self.duplicate_ratio, 'seed': self.seed
+        }
+
+    def _make_words(self, count):
+        """
+        Build a vocabulary of unique pseudo-words
+        :param count: The number of words to build
+        :type  count: int
+
+        :rtype: list of str
+        """
+        words = set()
+        length = 2
+        while len(words) < count:
+            word = ''.join(self._rng.choice(self.SYLLABLES) for _ in range(length))
+            if word in words:
+                # Grow the words once the shorter combinations start running out
+                length += self._rng.random() < 0.01
+                continue
+            words.add(word)
+
+        return sorted(words)
+
+    def _make_substitutions(self, count):
+        """
+        Map unique substitution words onto vocabulary words
+        :param count: The number of substitutions to build
+        :type  count: int
+
+        :rtype: list of tuple
+        """
+        vocabulary = set(self._words)
+        subs = []
+        while len(subs) < count:
+            word = 'x' + ''.join(self._rng.choice(self.SYLLABLES) for _ in range(3))
+            if word in vocabulary:
+                continue
+            vocabulary.add(word)
+            subs.append((word, self._rng.choice(self._words)))
+
+        return subs
+
+    def _make_triggers(self):
+        """
+        Build the trigger definitions for this brain
+        :rtype: list of dict
+        """
+        rng = self._rng
+        patterns = set()
+        triggers = []
+
+        # Every topic gets an entry trigger so it can actually be reached
+        for index in range(self.topics):
+            tokens = ['enter', 'topic', str(index)]
+            patterns.add(' '.join(tokens))
+            triggers.append({'tokens': tokens, 'topic': None, 'group': None, 'condition': False,
+                             'random': False, 'sets_topic': 'topic{i}'.format(i=index)})
+
+        while len(triggers) < self.triggers + self.topics:
+            # Repeat an earlier trigger in another topic
+            if len(triggers) > self.topics and rng.random() < self.duplicate_ratio:
+                trigger = dict(rng.choice(triggers[self.topics:]))
+                topic = 'topic{i}'.format(i=rng.randrange(self.topics)) if self.topics else None
+                trigger['topic'] = None if topic == trigger['topic'] else topic
+                triggers.append(trigger)
+                continue
+
+            tokens = [rng.choice(self._words) for _ in range(rng.randint(2, 6))]
+            if rng.random() < self.wildcard_ratio:
+                wildcard = rng.choice(self.WILDCARDS).format(word=rng.choice(self._words), alt=rng.choice(self._words))
+                tokens.insert(rng.randint(0, len(tokens)), wildcard)
+
+            pattern = ' '.join(tokens)
+            if pattern in patterns:
+                continue
+            patterns.add(pattern)
+
+            triggers.append({
+                'tokens': tokens,
+                'topic': 'topic{i}'.format(i=rng.randrange(self.topics)) if rng.random() < self.topic_ratio else None,
+                'group': 'group{i}'.format(i=rng.randrange(self.groups)) if rng.random() < self.group_ratio else None,
+                'condition': rng.random() < self.condition_ratio,
+                'random': rng.random() < self.random_ratio,
+                'sets_topic': None
+            })
+
+        return triggers
+
+    def _template(self, trigger, text):
+        """
+        Render a response template
+        :param trigger: The trigger definition
+        :type  trigger: dict
+
+        :param text: The template text
+        :type  text: str
+
+        :rtype: str
+        """
+        if not trigger['random']:
+            return '<template>{text}</template>'.format(text=escape(text))
+
+        items = ''.join('<item>{text} {i}</item>'.format(text=escape(text), i=i) for i in range(4))
+        return '<template><random>{items}</random></template>'.format(items=items)
+
+    def _render_trigger(self, trigger):
+        """
+        Render a single trigger element
+        :param trigger: The trigger definition
+        :type  trigger: dict
+
+        :rtype: str
+        """
+        pattern = ' '.join(trigger['tokens'])
+        text = 'reply to ' + pattern
+        lines = ['<trigger>', '<pattern>{pattern}</pattern>'.format(pattern=escape(pattern))]
+
+        if trigger['sets_topic']:
+            lines.append('<response><topic>{topic}</topic>{template}</response>'
+                         .format(topic=trigger['sets_topic'], template=self._template(trigger, text)))
+        elif trigger['condition']:
+            lines += [
+                '<condition>',
+                '<if name="level" gt="10">{template}</if>'.format(template=self._template(trigger, text + ' high')),
+                '<elif name="level" gte="5">{template}</elif>'.format(template=self._template(trigger, text + ' mid')),
+                '<elif name="mood" is="happy">{template}</elif>'.format(template=self._template(trigger, text)),
+                '<else>{template}</else>'.format(template=self._template(trigger, text + ' low')),
+                '</condition>'
+            ]
+        else:
+            lines.append(self._template(trigger, text))
+
+        lines.append('</trigger>')
+        return '\n'.join(lines)
+
+    def _render_file(self, triggers):
+        """
+        Render an AgentML document containing the specified triggers
+        :param triggers: The trigger definitions
+        :type  triggers: list of dict
+
+        :rtype: str
+        """
+        lines = ['<agentml version="0.1">']
+        for trigger in triggers:
+            element = self._render_trigger(trigger)
+            if trigger['group']:
+                element = '<group name={name}>\n{element}\n</group>'.format(name=quoteattr(trigger['group']),
+                                                                             element=element)
+            if trigger['topic']:
+                element = '<topic name={name}>\n{element}\n</topic>'.format(name=quoteattr(trigger['topic']),
+                                                                             element=element)
+            lines.append(element)
+
+        lines.append('</agentml>')
+        return '\n'.join(lines)
+
+    def write(self, dir_path):
+        """
+        Write the brain into a directory as a set of AgentML files
+        :param dir_path: Path to the directory, created if it does not exist
+        :type  dir_path: str
+
+        :return: The paths of the files written
+        :rtype : list of str
+        """
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+
+        documents = []
+        if self._subs:
+            subs = '\n'.join('<sub word={word}>{replacement}</sub>'.format(word=quoteattr(word),
+                                                                           replacement=replacement)
+                             for word, replacement in self._subs)
+            documents.append(('__init__.aml', '<agentml version="0.1">\n<init>\n<substitutions>\n{subs}\n'
+                                              '</substitutions>\n</init>\n</agentml>'.format(subs=subs)))
+
+        for index in range(self.files):
+            document = self._render_file(self._triggers[index::self.files])
+            documents.append(('brain_{i:03d}.aml'.format(i=index), document))
+
+        paths = []
+        for name, document in documents:
+            path = os.path.join(dir_path, name)
+            with open(path, 'w') as file:
+                file.write(document)
+            paths.append(path)
+
+        return paths
+
+    def _message_for(self, trigger):
+        """
+        Build a message that matches the specified trigger
+        :param trigger: The trigger definition
+        :type  trigger: dict
+
+        :rtype: str
+        """
+        rng = self._rng
+        words = []
+        for token in trigger['tokens']:
+            if token in ('*', '(*)'):
+                words += [rng.choice(self._words) for _ in range(rng.randint(1, 3))]
+            elif token in ('#', '(#)'):
+                words.append(str(rng.randint(0, 9999)))
+            elif token in ('_', '(_)'):
+                words.append(rng.choice(self._words))
+            elif token.startswith('['):
+                if rng.random() < 0.5:
+                    words.append(token[1:-1])
+            elif token.startswith('('):
+                words.append(rng.choice(token[1:-1].split('|')))
+            elif token in self._sub_words and rng.random() < 0.5:
+                words.append(self._sub_words[token])
+            else:
+                words.append(token)
+
+        return ' '.join(words)
+
+    def messages(self, count, miss_ratio=0.2):
+        """
+        Build a list of messages to send to the generated brain
+        :param count: The number of messages to build
+        :type  count: int
+
+        :param miss_ratio: The fraction of messages that should not match any trigger
+        :type  miss_ratio: float
+
+        :rtype: list of str
+        """
+        rng = self._rng
+        messages = []
+        for _ in range(count):
+            if rng.random() < miss_ratio:
+                messages.append(' '.join(rng.choice(self._words) for _ in range(rng.randint(2, 6))) + ' nomatch')
+                continue
+
+            messages.append(self._message_for(rng.choice(self._triggers)))
+
+        return messages
@@ -0,0 +1,300 @@
+"""
+Run the AgentML benchmark suite against a synthetic brain and emit the results as JSON
+
+    python -m benchmarks.run --triggers 5000 --wildcard-ratio 0.3 --output results.json
+"""
+from __future__ import division
+import argparse
+import gc
+import json
+import logging
+import platform
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+import agentml
+from agentml import AgentML
+from .generator import BrainGenerator
+
+try:
+    import tracemalloc
+except ImportError:
+    # Memory measurements are only available on Python 3.4+
+    tracemalloc = None
+
+
+def percentiles(samples, points=(50, 90, 95, 99)):
+    """
+    Summarize a list of timings in milliseconds
+    :param samples: Timings in seconds
+    :type  samples: list of float
+
+    :param points: The percentiles to report
+    :type  points: tuple of int
+
+    :rtype: dict
+    """
+    if not samples:
+        return {}
+
+    samples = sorted(samples)
+    summary = {'p{p}'.format(p=p): samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000 for p in points}
+    summary['mean'] = sum(samples) / len(samples) * 1000
+    summary['max'] = samples[-1] * 1000
+    return summary
+
+
+def count_triggers(aml):
+    """
+    Count the triggers loaded into an AgentML instance
+    :type  aml: AgentML
+    :rtype: int
+    """
+    return sum(len(triggers) for triggers in aml._triggers.values())
+
+
+def time_load(brain_dir, repeat, matcher='regex', lazy=False, stream=False, validation='full'):
+    """
+    Time loading and sorting the brain
+    :param brain_dir: Path to the generated brain
+    :type  brain_dir: str
+
+    :param repeat: The number of times to load the brain
+    :type  repeat: int
+
+    :param matcher: The matching engine to use
+    :type  matcher: str
+
+    :param lazy: Whether triggers are loaded lazily
+    :type  lazy: bool
+
+    :param stream: Whether files are loaded with the streaming loader
+    :type  stream: bool
+
+    :param validation: The schema validation mode, one of AgentML.VALIDATION_MODES
+    :type  validation: str
+
+    :return: The timings and the last AgentML instance loaded
+    :rtype : tuple of (dict, AgentML)
+    """
+    load, sort = [], []
+    aml = None
+    for _ in range(repeat):
+        aml = AgentML(log_level=logging.ERROR, matcher=matcher, lazy=lazy, validation=validation)
+
+        start = default_timer()
+        aml.load_directory(brain_dir, stream)
+        load.append(default_timer() - start)
+
+        start = default_timer()
+        aml.sort()
+        sort.append(default_timer() - start)
+
+    return {'load_directory': percentiles(load, (50,)), 'sort': percentiles(sort, (50,))}, aml
+
+
+def time_replies(aml, messages, users, warmup):
+    """
+    Time get_reply latency over a list of messages
+    :param aml: A loaded and sorted AgentML instance
+    :type  aml: AgentML
+
+    :param messages: The messages to send
+    :type  messages: list of str
+
+    :param users: The number of users to spread the messages across
+    :type  users: int
+
+    :param warmup: The number of messages to send before timings are recorded
+    :type  warmup: int
+
+    :rtype: dict
+    """
+    timings = []
+    hits = 0
+    for index, message in enumerate(messages):
+        user = 'user{i}'.format(i=index % users)
+
+        start = default_timer()
+        reply = aml.get_reply(user, message)
+        elapsed = default_timer() - start
+
+        if index < warmup:
+            continue
+        timings.append(elapsed)
+        hits += reply is not None
+
+    result = percentiles(timings)
+    result['count'] = len(timings)
+    result['hit_ratio'] = hits / len(timings) if timings else None
+    return result
+
+
+def measure_memory(brain_dir, users, lazy=False, stream=False, validation='full'):
+    """
+    Measure the memory allocated per trigger and per user
+    :param brain_dir: Path to the generated brain
+    :type  brain_dir: str
+
+    :param users: The number of users to create
+    :type  users: int
+
+    :param lazy: Whether triggers are loaded lazily
+    :type  lazy: bool
+
+    :param stream: Whether files are loaded with the streaming loader
+    :type  stream: bool
+
+    :param validation: The schema validation mode, one of AgentML.VALIDATION_MODES
+    :type  validation: str
+
+    :return: Bytes per trigger and bytes per user, or None for both if tracemalloc is unavailable
+    :rtype : dict
+    """
+    if tracemalloc is None:
+        return {'per_trigger': None, 'per_user': None}
+
+    aml = AgentML(log_level=logging.ERROR, lazy=lazy, validation=validation)
+    builtin_triggers = count_triggers(aml)
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        aml.load_directory(brain_dir, stream)
+        aml.sort()
+        gc.collect()
+        loaded = tracemalloc.get_traced_memory()[0]
+
+        for index in range(users):
+            user = aml.get_user('memory{i}'.format(i=index))
+            user.set_var('name', 'user{i}'.format(i=index))
+            user.set_var('level', str(index % 20))
+        gc.collect()
+        populated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    triggers = count_triggers(aml) - builtin_triggers
+    return {
+        'per_trigger': (loaded - baseline) / triggers if triggers else None,
+        'per_user': (populated - loaded) / users if users else None
+    }
+
+
+def run(generator, messages=2000, users=50, warmup=100, repeat=3, memory=True, brain_dir=None, matcher='regex',
+        lazy=False, stream=False, validation='full'):
+    """
+    Generate a brain and run every benchmark against it
+    :param generator: The brain generator
+    :type  generator: BrainGenerator
+
+    :param messages: The number of timed messages to send
+    :type  messages: int
+
+    :param users: The number of users to spread messages across and to measure memory with
+    :type  users: int
+
+    :param warmup: The number of untimed messages to send first
+    :type  warmup: int
+
+    :param repeat: The number of times to time loading and sorting
+    :type  repeat: int
+
+    :param memory: Whether memory usage should be measured
+    :type  memory: bool
+
+    :param brain_dir: Where to write the brain, a temporary directory is used and removed if not specified
+    :type  brain_dir: str or None
+
+    :param matcher: The matching engine to benchmark, one of AgentML.MATCHERS
+    :type  matcher: str
+
+    :param lazy: Whether triggers are loaded lazily
+    :type  lazy: bool
+
+    :param stream: Whether files are loaded with the streaming loader
+    :type  stream: bool
+
+    :param validation: The schema validation mode, one of AgentML.VALIDATION_MODES
+    :type  validation: str
+
+    :rtype: dict
+    """
+    cleanup = brain_dir is None
+    brain_dir = brain_dir or tempfile.mkdtemp(prefix='agentml-bench-')
+
+    try:
+        generator.write(brain_dir)
+        results, aml = time_load(brain_dir, repeat, matcher, lazy, stream, validation)
+        results['triggers'] = count_triggers(aml)
+        results['get_reply'] = time_replies(aml, generator.messages(warmup + messages), users, warmup)
+        if memory:
+            results['memory'] = measure_memory(brain_dir, users, lazy, stream, validation)
+    finally:
+        if cleanup:
+            shutil.rmtree(brain_dir, ignore_errors=True)
+
+    return {
+        'agentml': agentml.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'brain': generator.config,
+        'matcher': matcher,
+        'loading': {'lazy': lazy, 'stream': stream, 'validation': validation},
+        'units': {'time': 'milliseconds', 'memory': 'bytes'},
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark AgentML against a synthetic brain')
+    parser.add_argument('--triggers', type=int, default=1000, help='number of triggers to generate')
+    parser.add_argument('--wildcard-ratio', type=float, default=0.5, help='fraction of wildcard patterns')
+    parser.add_argument('--topics', type=int, default=10, help='number of distinct topics')
+    parser.add_argument('--topic-ratio', type=float, default=0.2, help='fraction of triggers inside of a topic')
+    parser.add_argument('--groups', type=int, default=5, help='number of distinct trigger groups')
+    parser.add_argument('--group-ratio', type=float, default=0.1, help='fraction of triggers inside of a group')
+    parser.add_argument('--condition-ratio', type=float, default=0.1, help='fraction of triggers with conditions')
+    parser.add_argument('--random-ratio', type=float, default=0.1, help='fraction of triggers with random tags')
+    parser.add_argument('--substitutions', type=int, default=50, help='number of word substitutions')
+    parser.add_argument('--files', type=int, default=10, help='number of files to spread triggers across')
+    parser.add_argument('--duplicate-ratio', type=float, default=0,
+                        help='fraction of triggers repeated in other topics')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the brain and message generator')
+    parser.add_argument('--messages', type=int, default=2000, help='number of timed get_reply calls')
+    parser.add_argument('--users', type=int, default=50, help='number of users to send messages as')
+    parser.add_argument('--warmup', type=int, default=100, help='number of untimed get_reply calls')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to time load_directory and sort')
+    parser.add_argument('--matcher', default='regex', choices=AgentML.MATCHERS, help='the matching engine to use')
+    parser.add_argument('--lazy', action='store_true', help='load triggers lazily')
+    parser.add_argument('--stream', action='store_true', help='load files with the streaming loader')
+    parser.add_argument('--validation', default='full', choices=AgentML.VALIDATION_MODES,
+                        help='the schema validation mode to load with')
+    parser.add_argument('--no-memory', action='store_true', help='skip the memory measurements')
+    parser.add_argument('--brain-dir', help='write the brain here and keep it, instead of a temporary directory')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    generator = BrainGenerator(
+        triggers=args.triggers, wildcard_ratio=args.wildcard_ratio, topics=args.topics, topic_ratio=args.topic_ratio,
+        groups=args.groups, group_ratio=args.group_ratio, condition_ratio=args.condition_ratio,
+        random_ratio=args.random_ratio, substitutions=args.substitutions, files=args.files,
+        duplicate_ratio=args.duplicate_ratio, seed=args.seed
+    )
+    results = run(generator, messages=args.messages, users=args.users, warmup=args.warmup, repeat=args.repeat,
+                  memory=not args.no_memory, brain_dir=args.brain_dir, matcher=args.matcher, lazy=args.lazy,
+                  stream=args.stream, validation=args.validation)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
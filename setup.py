@@ -62,7 +62,7 @@ setup(
 
     keywords=['bot', 'chatbot', 'chatterbot', 'ai', 'aiml', 'rivescript'],
 
-    packages=find_packages(exclude=['tests', 'demo']),
+    packages=find_packages(exclude=['tests', 'demo', 'benchmarks']),
     install_requires=['lxml>=3.4.4,<3.5', 'six>=1.10.0,<1.11'],
 
     package_data={
@@ -14,3 +14,21 @@ class FooBarType(ConditionType):
 
         if key == 'bar':
             return 'foo'
+
+
+class BulkStoreType(ConditionType):
+    """
+    Reads values from a dictionary standing in for an external database, recording every query made against it
+    """
+    def __init__(self, name):
+        super(BulkStoreType, self).__init__(name)
+        self.store = {}
+        self.queries = []
+
+    def get(self, agentml, user=None, key=None):
+        self.queries.append([key])
+        return self.store.get(key)
+
+    def prefetch(self, agentml, user=None, keys=()):
+        self.queries.append(sorted(keys))
+        return dict((key, self.store.get(key)) for key in keys)
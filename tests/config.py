@@ -10,13 +10,22 @@ class AgentMLTestCase(unittest.TestCase):
     """
     Base class for all AgentML test cases
     """
+    # The matching engine the test case runs against
+    matcher = 'regex'
+
+    # Whether the test brain is loaded with the streaming loader
+    stream = False
+
+    # Whether triggers are loaded lazily
+    lazy = False
+
     def setUp(self, **kwargs):
         """
         Set up the Unit Test
         """
-        self.aml = AgentML(log_level=logging.WARN)
+        self.aml = AgentML(log_level=logging.WARN, matcher=self.matcher, lazy=self.lazy)
         self.aml.add_condition('foo_bar', FooBarType)
-        self.aml.load_directory(os.path.join(os.path.dirname(self.aml.script_path), 'tests', 'lang'))
+        self.aml.load_directory(os.path.join(os.path.dirname(self.aml.script_path), 'tests', 'lang'), self.stream)
         self.username = "unittest"
         self.success = 'Success!'
         self.failure = 'Failure!'
@@ -1,5 +1,31 @@
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
 from time import sleep
+from agentml.parser.trigger import Trigger
+from agentml.common import WeightedChoices, WeightedSampler, BatchedRandom, VariableStore, ReadCache, \
+    compile_pattern
+from six import StringIO
+from lxml import etree
+from agentml import AgentML
+from agentml.constants import AnyGroup
+from agentml.errors import VarNotDefinedError
+from agentml.parser.trigger.condition.types import ConditionType, UserVarType
+from agentml.logger import JsonLinesSink
+from agentml.matcher import TokenTrie
+from agentml.profiler import Profiler
+from agentml.tracing import TraceHook, HistogramCollector, Histogram
+from benchmarks.generator import BrainGenerator
+from benchmarks.run import main as run_benchmark
 from .config import AgentMLTestCase
+from .conditions import BulkStoreType
 
 
 class BasicResponseTests(AgentMLTestCase):
@@ -22,6 +48,29 @@ class BasicResponseTests(AgentMLTestCase):
         self.get_reply('Atom.. test!', self.success)
         self.get_reply('A!T!O!M! T!E!S!T!', self.success)
 
+    def test_substitution_pass(self):
+        self.aml.set_substitution('atomic', 'nuclear')
+        self.aml.set_substitution('atom', 'molecule')
+
+        # Substitutions are applied in a single pass, and the first substitution of a word is kept
+        messages = self.aml.parse_substitutions(('atom atomic atoms', 'Atom atomic atoms', 'Atom, atomic atoms!'))
+        self.assertEqual(messages, ('atomic nuclear atoms', 'atomic nuclear atoms', 'atomic, nuclear atoms!'))
+        self.get_reply('atom test', self.success)
+
+    def test_substitution_case_folding(self):
+        # The dotted capital I matches "i" case-insensitively, but lowers to two characters
+        messages = self.aml.parse_substitutions(('im here', u'\u0130m here', u'\u0130\'m here'))
+        self.assertEqual(messages[0], 'i am here')
+        self.assertEqual(messages[1], u'\u0130m here')
+        self.get_reply(u'\u0130\'m here', None)
+
+    def test_raw_only_substitution(self):
+        # Underscores are stripped from normalized messages, so this substitution only applies to raw messages
+        aml = AgentML(log_level=logging.WARN)
+        aml.set_substitution('_', 'underscore')
+        messages = aml.parse_substitutions(('foo bar', 'foo bar', 'foo _ bar'))
+        self.assertEqual(messages, ('foo bar', 'foo bar', 'foo underscore bar'))
+
     def test_atomic_with_multiple_lines(self):
         self.get_reply('multiline atomic test', 'The quick brown fox jumps over the lazy dog')
 
@@ -201,6 +250,63 @@ class ChanceTests(AgentMLTestCase):
         self.chance('trigger chance')
 
 
+class WeightedRandomTests(unittest.TestCase):
+    def test_weighted_choices(self):
+        choices = WeightedChoices([('foo', 1), ('bar', 0), ('baz', 3)])
+        self.assertEqual({choices.choice() for _ in range(250)}, {'foo', 'baz'})
+        self.assertIsNone(WeightedChoices([]).choice())
+
+    def test_weighted_sampler(self):
+        sampler = WeightedSampler([('foo', 1), ('bar', 0), ('baz', 3), ('qux', 6)])
+        self.assertEqual(len(sampler), 3)
+
+        sampled = [sampler.pop() for _ in range(3)]
+        self.assertEqual(sorted(sampled), ['baz', 'foo', 'qux'])
+        self.assertIsNone(sampler.pop())
+
+
+class RandomTests(AgentMLTestCase):
+    def test_seeded_replies(self):
+        replies = [self.aml.get_reply(user, 'hello', rng=random.Random(42)) for user in range(5)]
+        self.assertEqual(len(set(replies)), 1)
+
+        self.aml.rng = BatchedRandom(42, batch_size=8)
+        replies = [self.aml.get_reply(self.username, 'response chance') for _ in range(20)]
+
+        self.aml.rng = BatchedRandom(42, batch_size=8)
+        self.assertEqual([self.aml.get_reply(self.username, 'response chance') for _ in range(20)], replies)
+
+
+class BatchedRandomTests(unittest.TestCase):
+    def test_shared_across_threads(self):
+        rng = BatchedRandom(42, batch_size=4)
+        drawn = []
+
+        def draw():
+            drawn.extend(rng.random() for _ in range(2000))
+
+        # Switch threads as often as possible, so they interleave between checking the batch and drawing from it
+        try:
+            interval, set_interval = sys.getswitchinterval(), sys.setswitchinterval
+            set_interval(1e-6)
+        except AttributeError:
+            interval, set_interval = sys.getcheckinterval(), sys.setcheckinterval
+            set_interval(1)
+
+        threads = [threading.Thread(target=draw) for _ in range(8)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            set_interval(interval)
+
+        # Every pre-drawn number is handed out exactly once
+        expected = BatchedRandom(42, batch_size=4)
+        self.assertEqual(sorted(drawn), sorted(expected.random() for _ in range(16000)))
+
+
 class VarTests(AgentMLTestCase):
     def test_get_user_var(self):
         self.aml.get_user(self.username)
@@ -250,6 +356,34 @@ class VarTests(AgentMLTestCase):
         self.get_reply('Get global var unittestone', 'foo')
         self.get_reply('Get global var unittesttwo', 'bar')
 
+    def test_numeric_vars(self):
+        self.aml.get_user(self.username)
+        self.aml.set_var('counter', '41', self.username)
+        self.assertEqual(self.aml.get_number('counter', self.username), 41.0)
+
+        self.aml.set_var('counter', 'forty two', self.username)
+        self.assertEqual(self.aml.get_var('counter', self.username), 'forty two')
+        self.assertIsNone(self.aml.get_number('counter', self.username))
+
+        self.aml.set_var('counter', '7')
+        self.assertEqual(self.aml.get_number('counter'), 7.0)
+        self.assertRaises(VarNotDefinedError, self.aml.get_number, 'undefined')
+
+
+class VariableStoreTests(unittest.TestCase):
+    def test_variable_store(self):
+        store = VariableStore(level='5')
+        self.assertEqual(store.number('level'), 5.0)
+
+        # Values written around __setitem__ are parsed when they're first read
+        store.update(level='10', name='chell')
+        self.assertEqual(store.number('level'), 10.0)
+        self.assertIsNone(store.number('name'))
+
+        del store['level']
+        self.assertRaises(KeyError, store.number, 'level')
+        self.assertEqual(dict(store), {'name': 'chell'})
+
 
 class ConditionTests(AgentMLTestCase):
     def test_condition(self):
@@ -298,6 +432,81 @@ class ConditionTests(AgentMLTestCase):
         self.get_reply('condition test 3', None)
         self.get_reply('condition test 4', 'The value of the condition variable is "50"')
 
+    def test_condition_elif_chain(self):
+        self.get_reply('condition test 5', 'Undefined')
+
+        for value, expected in [('foo', 'Foo'), ('bar', 'Bar'), ('baz', 'Baz'), ('50', 'Greater than 10'),
+                                ('5', 'Greater than or equal to 5'), ('qux', 'Defined')]:
+            self.aml.set_var('condition', value, self.username)
+            self.get_reply('condition test 5', expected)
+
+    def test_compiled_conditions(self):
+        lookups = []
+
+        class Loose(object):
+            """
+            An unhashable value that only compares equal to "two"
+            """
+            __hash__ = None
+
+            def __eq__(self, other):
+                return other == 'two'
+
+            def __ne__(self, other):
+                return not self == other
+
+        class CountingType(ConditionType):
+            def get(self, agentml, user=None, key=None):
+                lookups.append(key)
+                if key == 'loose':
+                    return Loose()
+                try:
+                    return user.get_var(key)
+                except VarNotDefinedError:
+                    return
+
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>counting condition test</pattern>'
+                       '<condition type="counting"><if name="level" is="1"><template>One</template></if>'
+                       '<elif name="level" gt="5"><template>Many</template></elif>'
+                       '<else><template>Other</template></else></condition></trigger>'
+                       '<trigger><pattern>mixed condition test</pattern>'
+                       '<condition type="counting"><if name="level" gt="5"><template>Many</template></if>'
+                       '<elif name="level" is="7"><template>Seven</template></elif>'
+                       '<elif name="level" is="1"><template>One</template></elif>'
+                       '<elif name="level" lte="0"><template>Zero</template></elif>'
+                       '<else><template>Other</template></else></condition></trigger>'
+                       '<trigger><pattern>unhashable condition test</pattern>'
+                       '<condition type="counting"><if name="loose" is="one"><template>One</template></if>'
+                       '<elif name="loose" is="two"><template>Two</template></elif>'
+                       '<else><template>Other</template></else></condition></trigger></agentml>')
+
+        try:
+            self.aml.load_file(path)
+        finally:
+            os.remove(path)
+
+        # Condition types may be added after the conditions using them are loaded
+        self.aml.add_condition('counting', CountingType)
+        self.aml.get_user(self.username)
+
+        for value, expected in [('1', 'One'), ('10', 'Many'), ('2', 'Other'), ('x', 'Other')]:
+            self.aml.set_var('level', value, self.username)
+            self.get_reply('counting condition test', expected)
+
+        # The whole if / elif chain tests the same variable, so it is only looked up once per evaluation
+        self.assertEqual(lookups, ['level'] * 4)
+
+        # Mixed "is" and numeric statements on the same variable are still tested in order, the first match winning
+        for value, expected in [('7', 'Many'), ('1', 'One'), ('1.0', 'Other'), ('0', 'Zero'), ('-2.5', 'Zero'),
+                                ('x', 'Other')]:
+            self.aml.set_var('level', value, self.username)
+            self.get_reply('mixed condition test', expected)
+
+        # Unhashable values can't be looked up in the decision table, and are compared statement by statement instead
+        self.get_reply('unhashable condition test', 'Two')
+
 
 class TopicTests(AgentMLTestCase):
     def test_enter_and_exit_topic(self):
@@ -316,6 +525,55 @@ class TopicTests(AgentMLTestCase):
         self.get_reply('atomic test', self.success)
         self.topic(None)
 
+    def test_exit_topic_resets_reads(self):
+        self.aml.get_user(self.username).topic = 'stale'
+        self.get_reply('stale topic test', self.success)
+        self.topic(None)
+
+    def test_exit_topic_logging(self):
+        self.get_reply('enter test topic', self.success)
+        self.get_reply('atomic test', self.success)
+        self.topic(None)
+
+        self.assertEqual(len(self.aml.request_log.entries), 2)
+        self.assertEqual(len(self.aml.response_log.entries), 2)
+        self.assertEqual(self.aml.request_log.most_recent().response.message, self.success)
+
+    def test_topic_index(self):
+        self.assertTrue(self.aml.has_topic('test'))
+        self.assertTrue(self.aml.has_topic(None))
+        self.assertFalse(self.aml.has_topic('nonexistent'))
+        self.assertEqual(self.aml._topics['test'], 10)
+
+    def test_missing_topic_warning(self):
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>enter missing topic</pattern>'
+                       '<response><topic>missing</topic><template>Success!</template></response></trigger></agentml>')
+
+        stream = StringIO()
+        handler = logging.StreamHandler(stream)
+        self.aml._log.addHandler(handler)
+        try:
+            self.aml.load_file(path)
+            self.aml.sort()
+        finally:
+            self.aml._log.removeHandler(handler)
+            os.remove(path)
+
+        self.assertIn('set the topic "missing", which has no triggers', stream.getvalue())
+
+        # Users are still moved into the topic, and then out of it again on their next message
+        self.get_reply('enter missing topic', self.success)
+        self.topic('missing')
+        self.get_reply('atomic test', self.success)
+        self.topic(None)
+
+    def test_exit_topic_with_groups(self):
+        self.get_reply('enter test topic', self.success)
+        self.get_reply('public group test', self.success, {None, 'public'})
+        self.topic(None)
+
 
 class GroupTests(AgentMLTestCase):
     def test_public_group(self):
@@ -339,6 +597,22 @@ class GroupTests(AgentMLTestCase):
         self.get_reply('test topic group test', None)
         self.topic(None)
 
+    def test_group_candidates(self):
+        self.aml.sort()
+        triggers = self.aml._sorted_triggers
+
+        for groups in [{None}, {'public'}, {None, 'group1', 'group2'}, {'group1', 'group2', 'group3'}, AnyGroup]:
+            for topic in [None, 'test']:
+                expected = [t for t in triggers if t.topic == topic and
+                            (groups is AnyGroup or groups.issuperset(t.groups or {None}))]
+                self.assertEqual(self.aml._group_candidates(topic, groups), expected)
+                self.assertEqual(self.aml._group_candidate_set(topic, groups), set(expected))
+
+        # Merged candidate lists and sets are reused by later requests
+        self.assertIs(self.aml._group_candidates(None, {'public'}), self.aml._group_candidates(None, {'public'}))
+        self.assertIs(self.aml._group_candidate_set(None, {'public'}),
+                      self.aml._group_candidate_set(None, {'public'}))
+
 
 class PriorityTests(AgentMLTestCase):
     def test_atomic_priority(self):
@@ -388,6 +662,27 @@ class RedirectTests(AgentMLTestCase):
         self.get_reply('shorthand redirect test', self.success)
         self.get_reply('bad redirect test', '')
 
+    def test_redirect_rng(self):
+        class CoinType(ConditionType):
+            def get(self, agentml, user=None, key=None):
+                return agentml.get_rng().choice(['heads'])
+
+        self.aml.add_condition('coin', CoinType)
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>coin test</pattern><condition type="coin">'
+                       '<if name="flip" is="heads"><template>Success!</template></if></condition></trigger>'
+                       '<trigger><pattern>coin redirect test</pattern><redirect>coin test</redirect></trigger>'
+                       '</agentml>')
+
+        try:
+            self.aml.load_file(path)
+        finally:
+            os.remove(path)
+
+        # Redirects hand out a tracking generator, which still supports the full random.Random interface
+        self.get_reply('coin redirect test', self.success)
+
     def test_atomic_redirect_with_topic(self):
         self.get_reply('enter test topic', self.success)
         self.topic('test')
@@ -429,6 +724,34 @@ class RedirectTests(AgentMLTestCase):
         self.get_reply('template default redirect test', 'Status: {status}!'.format(status=self.failure))
         self.get_reply('template bad redirect test', 'Status: !')
 
+    def test_redirect_loop(self):
+        self.get_reply('redirect loop test', '')
+
+    def test_redirect_depth(self):
+        self.aml.max_redirect_depth = 0
+        self.get_reply('redirect test', '')
+
+    def test_repeated_redirect(self):
+        match = Trigger.match
+        calls = []
+
+        def counting_match(trigger, user, message):
+            if trigger.pattern == 'redirect destination':
+                calls.append(message)
+            return match(trigger, user, message)
+
+        Trigger.match = counting_match
+        try:
+            self.get_reply('repeated redirect test', 'Success! Success!')
+        finally:
+            Trigger.match = match
+
+        self.assertEqual(len(calls), 1)
+
+    def test_repeated_redirect_with_side_effects(self):
+        self.get_reply('repeated var redirect test', 'Setting user variable counter to one one '
+                                                     'Setting user variable counter to two two')
+
 
 class LoggerTests(AgentMLTestCase):
     def test_request_logger(self):
@@ -470,6 +793,56 @@ class LoggerTests(AgentMLTestCase):
 
         self.assertEqual(len(self.aml.response_log.entries), 3)
 
+    def test_log_records(self):
+        self.get_reply('atomic test', self.success)
+        request = self.aml.request_log.most_recent()
+        response = self.aml.response_log.most_recent()
+
+        self.assertEqual(request.user_id, self.username)
+        self.assertEqual(request.groups, frozenset([None]))
+        self.assertEqual(request.response.id, response.id)
+        self.assertEqual(response.request.id, request.id)
+        self.assertIn('tests.aml:', response.trigger)
+        self.assertLessEqual(request.timestamp, response.timestamp)
+        self.assertRaises(AttributeError, setattr, request, 'message', 'foo')
+
+        # Ids keep increasing as older entries fall out of the buffer
+        self.aml.request_log.max_entries = 1
+        self.get_reply('required test', None)
+        self.assertEqual(len(self.aml.request_log.entries), 1)
+        self.assertEqual(self.aml.request_log.most_recent().id, request.id + 1)
+
+    def test_json_lines_export(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            sink = JsonLinesSink(path, batch_size=3)
+            self.aml.request_log.add_sink(sink)
+            self.aml.response_log.add_sink(sink)
+
+            self.get_reply('atomic test', self.success)
+            self.get_reply('required test', None)
+            self.get_reply('required foo test', 'foo')
+
+            # Records are written out in batches
+            with open(path) as file:
+                self.assertEqual(len(file.readlines()), 3)
+
+            sink.close()
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+        finally:
+            os.remove(path)
+
+        self.assertEqual([record['type'] for record in records],
+                         ['response', 'request', 'request', 'response', 'request'])
+        self.assertEqual(records[0]['request_id'], records[1]['id'])
+        self.assertEqual(records[1]['response_id'], records[0]['id'])
+        self.assertEqual(records[2]['message'], 'required test')
+        self.assertIsNone(records[2]['response_id'])
+        self.assertEqual(records[3]['message'], 'foo')
+        self.assertEqual(records[4]['groups'], [None])
+
 
 class CustomConditionTypeTests(AgentMLTestCase):
     def test_foo_bar_condition_type(self):
@@ -479,3 +852,532 @@ class CustomConditionTypeTests(AgentMLTestCase):
         self.get_reply('custom condition test four', self.success)
         self.get_reply('custom condition test five', self.success)
         self.get_reply('custom condition test six', None)
+
+    def test_prefetch_condition_type(self):
+        self.aml.add_condition('bulk_store', BulkStoreType)
+        bulk_store = self.aml.conditions['bulk_store']
+        bulk_store.store = {'plan': 'pro', 'credits': '5', 'region': 'us'}
+
+        self.get_reply('bulk condition test', 'Pro')
+        self.assertEqual(bulk_store.queries, [['credits', 'plan', 'region']])
+
+        bulk_store.store['credits'] = '50'
+        self.get_reply('bulk condition test', ['Pro', 'Credits'])
+        self.assertEqual(len(bulk_store.queries), 2)
+
+    def test_request_read_cache(self):
+        lookups = []
+
+        class CountingVarType(UserVarType):
+            def __init__(self, name):
+                super(CountingVarType, self).__init__()
+
+            def get(self, agentml, user=None, key=None):
+                lookups.append(key)
+                return super(CountingVarType, self).get(agentml, user, key)
+
+        self.aml.add_condition('user_var', CountingVarType)
+        self.aml.set_var('plan', 'pro', self.aml.get_user(self.username).id)
+
+        # Condition blocks, condition tags, variable tags and redirects all share the values read during the request
+        self.get_reply('memo condition test', 'Pro pro again')
+        self.assertEqual(lookups, ['plan'])
+
+        # Writing a variable only discards the values it may have changed
+        self.get_reply('memo write test', 'Written')
+        self.get_reply('memo write test', None)
+
+        reads = ReadCache({('user_var', 'memo'): 'a', ('user_var', 'other'): 'b', ('topic', None): None,
+                           ('bulk_store', 'plan'): 'pro'})
+        reads.invalidate('user_var', 'memo')
+        self.assertEqual(sorted(reads), [('topic', None), ('user_var', 'other')])
+
+
+class BenchmarkGeneratorTests(AgentMLTestCase):
+    def test_generated_brain(self):
+        brain_dir = tempfile.mkdtemp()
+        try:
+            generator = BrainGenerator(triggers=100, topics=2, groups=2, substitutions=10, files=3, vocabulary=200)
+            self.assertEqual(len(generator.write(brain_dir)), 4)
+
+            aml = AgentML(log_level=logging.ERROR)
+            aml.load_directory(brain_dir)
+            aml.sort()
+        finally:
+            shutil.rmtree(brain_dir)
+
+        self.assertEqual(len(aml._sorted_triggers), 102)
+        self.assertEqual(aml.get_reply('bench', 'enter topic 1'), 'reply to enter topic 1')
+        self.assertEqual(aml.get_user('bench').topic, 'topic1')
+
+        # The same seed always produces the same messages
+        self.assertEqual(generator.messages(20), BrainGenerator(triggers=100, topics=2, groups=2, substitutions=10,
+                                                                files=3, vocabulary=200).messages(20))
+
+    def test_loading_options(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            run_benchmark(['--triggers', '50', '--topics', '2', '--files', '2', '--messages', '20', '--warmup', '0',
+                           '--repeat', '1', '--no-memory', '--lazy', '--stream', '--validation', 'off',
+                           '--output', path])
+            with open(path) as file:
+                results = json.load(file)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(results['loading'], {'lazy': True, 'stream': True, 'validation': 'off'})
+        self.assertEqual(results['results']['get_reply']['count'], 20)
+
+
+class ProfilerTests(AgentMLTestCase):
+    def test_profiler_disabled(self):
+        self.assertIsNone(self.aml.profiler)
+        self.get_reply('atomic test', self.success)
+
+    def test_trigger_stats(self):
+        self.aml.profiler = Profiler()
+        self.get_reply('atomic test', self.success)
+        self.get_reply('atomic test', self.success)
+        self.get_reply('condition test one', self.failure)
+
+        stats = dict((stats.pattern, stats) for stats in self.aml.profiler.report())
+        self.assertEqual(stats['atomic test'].attempts, 3)
+        self.assertEqual(stats['atomic test'].hits, 2)
+        self.assertGreater(stats['atomic test'].render_time, 0)
+        self.assertEqual(stats['atomic test'].condition_time, 0)
+
+        # Triggers tested and rejected are counted as attempts without hits
+        missed = [s for s in stats.values() if s.attempts and not s.hits]
+        self.assertTrue(missed)
+        self.assertTrue(all(s.cost == s.regex_time for s in missed))
+
+        conditional = [s for s in stats.values() if s.condition_time]
+        self.assertEqual(len(conditional), 1)
+        self.assertEqual(conditional[0].hits, 1)
+
+    def test_report(self):
+        self.aml.profiler = Profiler()
+        self.get_reply('atomic test', self.success)
+        self.get_reply('optional foo test 1', self.success)
+
+        report = self.aml.profiler.report('attempts', limit=3)
+        self.assertEqual(len(report), 3)
+        self.assertGreaterEqual(report[0].attempts, report[1].attempts)
+        self.assertRaises(ValueError, self.aml.profiler.report, 'pattern')
+
+        stream = StringIO()
+        self.aml.profiler.dump(stream, sort='hits', limit=2)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].split()[0] == 'attempts')
+
+        self.aml.profiler.reset()
+        self.assertEqual(self.aml.profiler.report(), [])
+
+
+class TracingTests(AgentMLTestCase):
+    class RecordingHook(TraceHook):
+        def __init__(self):
+            self.events = []
+
+        def start(self, stage):
+            self.events.append(('start', stage))
+
+        def end(self, stage, elapsed):
+            self.events.append(('end', stage))
+
+    def test_trace_hooks(self):
+        hook = self.RecordingHook()
+        self.aml.add_trace_hook(hook)
+        self.get_reply('redirect test', self.success)
+
+        # Stages are properly nested within the request
+        self.assertEqual(hook.events[0], ('start', 'request'))
+        self.assertEqual(hook.events[-1], ('end', 'request'))
+        stack = []
+        for event, stage in hook.events:
+            if event == 'start':
+                stack.append(stage)
+            else:
+                self.assertEqual(stack.pop(), stage)
+        self.assertEqual(stack, [])
+
+        stages = set(stage for event, stage in hook.events)
+        self.assertEqual(stages, {'request', 'normalize', 'candidates', 'match', 'select', 'render', 'redirect'})
+
+        self.aml.remove_trace_hook(hook)
+        self.assertIsNone(self.aml.tracer)
+        self.get_reply('atomic test', self.success)
+        self.assertEqual(hook.events[-1], ('end', 'request'))
+
+    def test_histogram_collector(self):
+        collector = HistogramCollector()
+        self.aml.add_trace_hook(collector)
+        self.get_reply('atomic test', self.success)
+        self.get_reply('condition test one', self.failure)
+        self.get_reply('optional foo test 1', self.success)
+
+        summary = collector.summary()
+        self.assertEqual(summary['request']['count'], 3)
+        self.assertEqual(summary['match']['count'], 3)
+        self.assertEqual(summary['conditions']['count'], 1)
+        self.assertLessEqual(summary['match']['max'], summary['request']['max'])
+        self.assertLessEqual(summary['request']['p50'], summary['request']['max'])
+
+        collector.reset()
+        self.assertEqual(collector.summary(), {})
+
+
+class HistogramTests(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+
+        for value in [0.001] * 98 + [0.1, 0.2]:
+            histogram.add(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertLess(histogram.percentile(50), 0.0011)
+        self.assertGreaterEqual(histogram.percentile(50), 0.001)
+        self.assertGreaterEqual(histogram.percentile(99), 0.1)
+        self.assertEqual(histogram.percentile(100), 0.2)
+
+
+class CompilePatternTests(unittest.TestCase):
+    def test_compile_pattern(self):
+        pattern = compile_pattern(r'^foo (.+)$', re.IGNORECASE)
+        self.assertIs(compile_pattern(r'^foo (.+)$', re.IGNORECASE), pattern)
+        self.assertIsNot(compile_pattern(r'^foo (.+)$'), pattern)
+
+
+class PatternCacheTests(AgentMLTestCase):
+    def test_shared_trigger_patterns(self):
+        aml = AgentML(log_level=logging.WARN)
+        aml.load_directory(os.path.join(os.path.dirname(aml.script_path), 'tests', 'lang'))
+        aml.sort()
+        self.aml.sort()
+
+        # Identical patterns compile to the same regular expression across AgentML instances
+        for ours, theirs in zip(self.aml._sorted_triggers, aml._sorted_triggers):
+            if not ours.pattern_is_atomic:
+                self.assertIs(ours.pattern, theirs.pattern)
+
+
+class InterningTests(AgentMLTestCase):
+    def test_interned_triggers(self):
+        trigger = """
+            <trigger>
+                <pattern>interned pattern test</pattern>
+                <template>Interned <random><item>foo</item><item>bar</item></random></template>
+            </trigger>
+            <trigger>
+                <pattern>interned template test</pattern>
+                <template>Success!</template>
+            </trigger>
+        """
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1">{trigger}<topic name="interned">{trigger}</topic></agentml>'
+                       .format(trigger=trigger))
+
+        try:
+            aml = AgentML(log_level=logging.WARN)
+            aml.load_file(path)
+        finally:
+            os.remove(path)
+
+        first, second = [t for t in aml._triggers[0] if t.pattern == 'interned pattern test']
+        self.assertIsNot(first, second)
+        self.assertIs(first.pattern, second.pattern)
+
+        # Literal template chunks and static random choices are stored once
+        first_response = list(first._responses._responses.values())[0][0]._response
+        second_response = list(second._responses._responses.values())[0][0]._response
+        self.assertIs(first_response[0], second_response[0])
+        self.assertIs(first_response[1]._choices, second_response[1]._choices)
+
+        first, second = [t for t in aml._triggers[0] if t.pattern == 'interned template test']
+        self.assertIs(list(first._responses._responses.values())[0][0]._response,
+                      list(second._responses._responses.values())[0][0]._response)
+
+        # The interning table is kept after sorting, until it is explicitly released
+        self.assertIn(aml.get_reply('interned', 'interned pattern test'), ['Interned foo', 'Interned bar'])
+        self.assertTrue(aml._interned)
+        aml.clear_interned()
+        self.assertEqual(aml._interned, {})
+
+    def test_interned_across_sorts(self):
+        paths = []
+        for topic in ('first', 'second'):
+            fd, path = tempfile.mkstemp(suffix='.aml')
+            with os.fdopen(fd, 'w') as file:
+                file.write('<agentml version="0.1"><topic name="{topic}"><trigger><pattern>interned sort test</pattern>'
+                           '<template>Success!</template></trigger></topic></agentml>'.format(topic=topic))
+            paths.append(path)
+
+        aml = AgentML(log_level=logging.WARN)
+        try:
+            aml.load_file(paths[0])
+            aml.sort()
+            aml.load_file(paths[1])
+            aml.sort()
+        finally:
+            for path in paths:
+                os.remove(path)
+
+        first, second = [t for t in aml._sorted_triggers if t.pattern_text == 'interned sort test']
+        self.assertIs(first.pattern_text, second.pattern_text)
+        self.assertIs(list(first._responses._responses.values())[0][0]._response,
+                      list(second._responses._responses.values())[0][0]._response)
+
+
+class TokenTrieTests(unittest.TestCase):
+    def test_expand(self):
+        self.assertEqual(TokenTrie.expand('hello (*) #'), [('hello', '*', '#')])
+        self.assertEqual(TokenTrie.expand('(foo|bar baz) _'), [('foo', '_'), ('bar', 'baz', '_')])
+        self.assertEqual(TokenTrie.expand('optional [foo|bar] test'),
+                         [('optional', 'foo', 'test'), ('optional', 'bar', 'test'), ('optionaltest',),
+                          ('optional', 'test')])
+
+        # Patterns the trie can't represent faithfully
+        self.assertIsNone(TokenTrie.expand('foo*'))
+        self.assertIsNone(TokenTrie.expand('foo [bar] *'))
+        self.assertIsNone(TokenTrie.expand('foo  bar'))
+        self.assertIsNone(TokenTrie.expand('foo_bar'))
+
+
+class TrieMatcherTests(AgentMLTestCase):
+    matcher = 'trie'
+
+    def test_unknown_matcher(self):
+        self.assertRaises(ValueError, AgentML, matcher='dfa')
+
+    def test_candidates(self):
+        self.aml.sort()
+        triggers = self.aml._sorted_triggers
+        candidates = self.aml._trie.candidates('wildcard test foo')
+
+        # Candidates are in sorted order, and include every trigger that matches the message
+        self.assertEqual(candidates, sorted(candidates, key=triggers.index))
+        self.assertEqual([t for t in triggers if t.matches('wildcard test foo')],
+                         [t for t in candidates if t.matches('wildcard test foo')])
+        self.assertLess(len(candidates), len(triggers))
+
+        # Irregular spacing can only be handled by the regular expressions
+        self.assertIsNone(self.aml._trie.candidates('wildcard  test foo'))
+
+
+class TrieBasicResponseTests(BasicResponseTests):
+    matcher = 'trie'
+
+
+class TrieStarFormattingTests(StarFormattingTests):
+    matcher = 'trie'
+
+
+class TrieTopicTests(TopicTests):
+    matcher = 'trie'
+
+
+class TrieGroupTests(GroupTests):
+    matcher = 'trie'
+
+
+class TriePriorityTests(PriorityTests):
+    matcher = 'trie'
+
+
+class StreamLoaderTests(AgentMLTestCase):
+    stream = True
+
+    def test_streamed_triggers(self):
+        aml = AgentML(log_level=logging.WARN)
+        aml.load_directory(os.path.join(os.path.dirname(aml.script_path), 'tests', 'lang'))
+        aml.sort()
+        self.aml.sort()
+
+        patterns = [(t.pattern_text, t.topic, t.groups) for t in aml._sorted_triggers]
+        self.assertEqual([(t.pattern_text, t.topic, t.groups) for t in self.aml._sorted_triggers], patterns)
+
+    def test_invalid_trigger(self):
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1"><topic name="streamed"><trigger><pattern>streamed test</pattern>'
+                       '<template>Streamed</template></trigger></topic><trigger><template>Invalid</template>'
+                       '</trigger></agentml>')
+
+        try:
+            self.assertRaises(etree.DocumentInvalid, AgentML(log_level=logging.ERROR).load_file, path)
+            self.assertRaises(etree.DocumentInvalid, self.aml.load_file, path, True)
+        finally:
+            os.remove(path)
+
+        # Triggers read before the invalid element remain loaded
+        self.aml.get_user(self.username).topic = 'streamed'
+        self.get_reply('streamed test', 'Streamed')
+
+
+class StreamBasicResponseTests(BasicResponseTests):
+    stream = True
+
+
+class StreamConditionTests(ConditionTests):
+    stream = True
+
+
+class StreamTopicTests(TopicTests):
+    stream = True
+
+
+class StreamGroupTests(GroupTests):
+    stream = True
+
+
+class ValidationModeTests(AgentMLTestCase):
+    def setUp(self, **kwargs):
+        super(ValidationModeTests, self).setUp(**kwargs)
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.cache_dir, 'agentml', 'validated')
+
+        # Valid syntax, except for the missing version attribute
+        fd, self.path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml><trigger><pattern>unversioned test</pattern><template>Unversioned</template>'
+                       '</trigger></agentml>')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        os.remove(self.path)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, AgentML, validation='partial')
+
+    def test_validation_off(self):
+        self.assertRaises(etree.DocumentInvalid, self.aml.load_file, self.path)
+
+        aml = AgentML(log_level=logging.ERROR, validation='off')
+        aml.load_file(self.path)
+        self.assertEqual(aml.get_reply('validation', 'unversioned test'), 'Unversioned')
+
+    def test_validate_once(self):
+        aml = AgentML(log_level=logging.ERROR, validation='once', validation_cache=self.cache)
+        self.assertRaises(etree.DocumentInvalid, aml.load_file, self.path)
+
+        # Files that passed validation are recorded, including the internal AgentML files
+        with open(self.cache) as file:
+            validated = file.read().split()
+        self.assertTrue(validated)
+
+        # Unchanged files are not validated again by later instances
+        with open(self.path, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>validated test</pattern>'
+                       '<template>Validated</template></trigger></agentml>')
+        aml.load_file(self.path)
+
+        aml = AgentML(log_level=logging.ERROR, validation='once', validation_cache=self.cache)
+        aml._schema = None
+        aml.load_file(self.path)
+        self.assertEqual(aml.get_reply('validation', 'validated test'), 'Validated')
+
+        with open(self.cache) as file:
+            self.assertEqual(len(file.read().split()), len(validated) + 1)
+
+    def test_validate_once_streamed(self):
+        # Each element is valid, but the document as a whole is not
+        with open(self.path, 'w') as file:
+            file.write('<agentml version="0.1"><bogus/><trigger><pattern>streamed test</pattern>'
+                       '<template>Streamed</template></trigger></agentml>')
+
+        aml = AgentML(log_level=logging.ERROR, validation='once', validation_cache=self.cache)
+        aml.load_file(self.path, True)
+        self.assertEqual(aml.get_reply('validation', 'streamed test'), 'Streamed')
+
+        # Passing element by element validation doesn't excuse the whole document from validation
+        aml = AgentML(log_level=logging.ERROR, validation='once', validation_cache=self.cache)
+        self.assertRaises(etree.DocumentInvalid, aml.load_file, self.path)
+
+        # Documents that passed whole document validation don't need to be validated again when streamed
+        with open(self.path, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>streamed test</pattern>'
+                       '<template>Streamed</template></trigger></agentml>')
+        aml.load_file(self.path)
+
+        aml = AgentML(log_level=logging.ERROR, validation='once', validation_cache=self.cache)
+        aml._element_schemas = {'init': None, 'trigger': None}
+        aml.load_file(self.path, True)
+        self.assertEqual(aml.get_reply('validation', 'streamed test'), 'Streamed')
+
+
+class MessageCacheTests(AgentMLTestCase):
+    def test_cached_messages(self):
+        parsed = self.aml.parse_message("I'm  here")
+        self.assertEqual(parsed, ('i am  here', 'I am  here', "I am  here", None))
+        self.assertIs(self.aml.parse_message("I'm  here"), parsed)
+        self.assertEqual(self.aml.parse_message('Atom test!')[3], ('atomic', 'test'))
+
+        # The least recently used messages are discarded first
+        self.aml.message_cache_size = 2
+        self.aml.parse_message("I'm  here")
+        self.aml.parse_message('new message')
+        self.assertEqual(list(self.aml._message_cache), ["I'm  here", 'new message'])
+
+    def test_substitution_invalidates(self):
+        self.get_reply('nucleus test', None)
+        self.aml.set_substitution('nucleus', 'atomic')
+        self.assertEqual(self.aml.parse_message('nucleus test')[0], 'atomic test')
+        self.get_reply('nucleus test', self.success)
+
+
+class LazyLoadingTests(AgentMLTestCase):
+    lazy = True
+
+    def test_materialize_on_match(self):
+        self.aml.sort()
+        triggers = dict((t.pattern_text, t) for t in self.aml._sorted_triggers if t.topic is None)
+        self.assertFalse(triggers['atomic test'].materialized)
+
+        self.get_reply('atomic test', self.success)
+        self.assertTrue(triggers['atomic test'].materialized)
+        self.assertFalse(triggers['multiline atomic test'].materialized)
+
+
+class LazyBasicResponseTests(BasicResponseTests):
+    lazy = True
+
+
+class LazyConditionTests(ConditionTests):
+    lazy = True
+
+
+class LazyVarTests(VarTests):
+    lazy = True
+
+
+class LazyTopicTests(TopicTests):
+    lazy = True
+
+    def test_missing_topic_warning(self):
+        fd, path = tempfile.mkstemp(suffix='.aml')
+        with os.fdopen(fd, 'w') as file:
+            file.write('<agentml version="0.1"><trigger><pattern>enter missing topic</pattern>'
+                       '<response><topic>missing</topic><template>Success!</template></response></trigger></agentml>')
+
+        stream = StringIO()
+        handler = logging.StreamHandler(stream)
+        self.aml._log.addHandler(handler)
+        try:
+            self.aml.load_file(path)
+            self.aml.sort()
+
+            # Lazily loaded triggers aren't checked when sorting, only when their responses are applied
+            self.assertNotIn('"missing"', stream.getvalue())
+            self.get_reply('enter missing topic', self.success)
+        finally:
+            self.aml._log.removeHandler(handler)
+            os.remove(path)
+
+        self.assertIn('Setting User Topic to "missing", which has no triggers', stream.getvalue())
+
+
+class LazyRedirectTests(RedirectTests):
+    lazy = True